@@ -0,0 +1,97 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.urls import URLPattern, URLResolver
+
+from .views import IngridientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+
+# Действия на чтение, которые под ASGI выполняются в общем пуле потоков.
+ASYNC_READ_ACTIONS = {
+    RecipeViewSet: ('list', 'retrieve'),
+    TagViewSet: ('list', 'retrieve'),
+    IngridientViewSet: ('list', 'retrieve'),
+    UserViewSet: ('subscriptions',),
+}
+READ_METHODS = ('GET', 'HEAD')
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_VIEW_WORKERS,
+            thread_name_prefix='async-view'
+        )
+    return _executor
+
+
+def run_view(view, request, *args, **kwargs):
+    """
+    Выполняет синхронное представление в потоке пула.
+    Соединения с базой у потоков свои, поэтому закрываются здесь,
+    как это делают сигналы начала и конца запроса.
+    """
+    stats = getattr(request, 'query_stats', None)
+    close_old_connections()
+    try:
+        with connection.execute_wrapper(stats) if stats else nullcontext():
+            return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def is_read_view(view):
+    cls = getattr(view, 'cls', None)
+    actions = getattr(view, 'actions', None) or {}
+    return actions.get('get') in ASYNC_READ_ACTIONS.get(cls, ())
+
+
+def as_async_view(view):
+    """
+    Асинхронная обёртка представления для ASGI.
+    Чтение из ASYNC_READ_ACTIONS выполняется в пуле из ASYNC_VIEW_WORKERS
+    потоков и не ждёт других запросов; остальные запросы, как и прежде,
+    выполняются в общем потоке синхронного кода Django.
+    """
+    read = sync_to_async(
+        functools.partial(run_view, view),
+        thread_sensitive=False,
+        executor=get_executor()
+    ) if is_read_view(view) else None
+    write = sync_to_async(functools.partial(run_view, view))
+
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if read is not None and request.method in READ_METHODS:
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    return async_view
+
+
+def get_async_urlpatterns(patterns):
+    """Те же маршруты с асинхронными представлениями."""
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            result.append(URLResolver(
+                pattern.pattern,
+                get_async_urlpatterns(pattern.url_patterns),
+                pattern.default_kwargs,
+                pattern.app_name,
+                pattern.namespace
+            ))
+        else:
+            result.append(URLPattern(
+                pattern.pattern,
+                as_async_view(pattern.callback),
+                pattern.default_args,
+                pattern.name
+            ))
+    return result
@@ -0,0 +1,92 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    LRU-кэш токен -> (пользователь, токен) в памяти процесса.
+    Записи живут TOKEN_CACHE_TIMEOUT секунд, их не больше TOKEN_CACHE_SIZE.
+    Запросы получают копии, сами снимки не меняются.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, user, token = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+    def set(self, key, user, token, generation):
+        """
+        Сохраняет снимок, прочитанный при поколении generation.
+        Если с тех пор записи сбрасывались, снимок мог устареть.
+        """
+        token = copy.copy(token)
+        token._state.fields_cache = {}
+        entry = (
+            time.monotonic() + settings.TOKEN_CACHE_TIMEOUT,
+            copy.copy(user),
+            token
+        )
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            self.generation += 1
+            for key, (expires, user, token) in list(self._entries.items()):
+                if user.pk == user_id:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к базе для известных токенов.
+    Записи сбрасываются сигналами при удалении токена (выход),
+    изменении пользователя (пароль, is_active) и его удалении.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        generation = token_cache.generation
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token, generation)
+        return user, token
@@ -0,0 +1,88 @@
+import threading
+from bisect import bisect_left
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Q
+
+from recipes.models import Ingridient
+from recipes.validators import PREFIX_UPPER_BOUND, normalize_name
+from .cache import get_version_key, get_versions
+
+
+def get_prefix_range(value):
+    """Условие начала search_name с value - диапазон по индексу."""
+    return Q(
+        search_name__gte=value,
+        search_name__lt=value + PREFIX_UPPER_BOUND
+    )
+
+
+class IngridientIndex:
+    """
+    Каталог ингридиентов в памяти процесса - массив, отсортированный
+    по search_name. Начало названия ищется двоичным поиском, вхождение -
+    проходом по массиву до набора нужного числа строк.
+    Перечитывается из базы при смене версии справочника Ingridient.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def load(self):
+        keys = []
+        items = []
+        rows = Ingridient.objects.order_by('search_name', 'id').values_list(
+            'search_name', 'id', 'name'
+        )
+        for search_name, id, name in rows.iterator():
+            keys.append(search_name)
+            items.append({'id': id, 'name': name})
+        return keys, items
+
+    def get_data(self):
+        [version] = get_versions([get_version_key(Ingridient)])
+        data = self._data
+        if data is not None and data[0] == version:
+            return data
+        with self._lock:
+            if self._data is None or self._data[0] != version:
+                self._data = (version, *self.load())
+            return self._data
+
+    def search(self, value, limit):
+        version, keys, items = self.get_data()
+        start = bisect_left(keys, value)
+        end = bisect_left(keys, value + PREFIX_UPPER_BOUND, start)
+        result = items[start:min(end, start + limit)]
+        if len(result) < limit:
+            others = chain(range(start), range(end, len(keys)))
+            for index in others:
+                if value in keys[index]:
+                    result.append(items[index])
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingridient_index = IngridientIndex()
+
+
+def search_ingridients(value, limit):
+    """
+    Ингридиенты для автодополнения: сначала начинающиеся с value,
+    затем содержащие value, внутри групп - по названию.
+    Подстрока ищется, только если совпадений по началу меньше limit.
+    """
+    value = normalize_name(value)
+    if settings.INGRIDIENT_INDEX_CACHE:
+        return ingridient_index.search(value, limit)
+    queryset = Ingridient.objects.order_by('search_name', 'id')
+    prefix = get_prefix_range(value)
+    result = list(queryset.filter(prefix).values('id', 'name')[:limit])
+    if len(result) < limit:
+        result += queryset.filter(search_name__contains=value).exclude(
+            prefix
+        ).values('id', 'name')[:limit - len(result)]
+    return result
@@ -0,0 +1,95 @@
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+
+def get_version_key(model):
+    """Ключ версии модели справочника."""
+    return f'version:{model._meta.label_lower}'
+
+
+def get_versions(keys):
+    """
+    Версии - случайные метки в кэше Django.
+    Пропавшая из кэша версия создаётся заново, поэтому старые
+    ответы никогда не выдаются под новой версией.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid4().hex
+            cache.add(key, version, settings.CATALOG_CACHE_TIMEOUT)
+            versions[key] = cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def bump_version(key):
+    cache.set(key, uuid4().hex, settings.CATALOG_CACHE_TIMEOUT)
+
+
+def make_etag(*parts):
+    """Сильный ETag из частей состояния ответа."""
+    value = ':'.join(str(part) for part in parts)
+    return '"%s"' % hashlib.md5(value.encode()).hexdigest()
+
+
+class CatalogCacheMixin:
+    """
+    Кэш готовых JSON-ответов справочников.
+    Ключ и ETag строятся из версий моделей catalog_models и адреса
+    запроса, поэтому If-None-Match и попадание в кэш обходятся
+    без запросов к базе и сериализаторов.
+    Ответ не зависит от пользователя: вьюсеты справочников
+    не проверяют токен (пустые authentication_classes).
+    """
+    catalog_models = ()
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+        etag = make_etag(
+            *get_versions([
+                get_version_key(model) for model in self.catalog_models
+            ]),
+            request.get_full_path(),
+            request.accepted_media_type
+        )
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        cache_key = f'catalog:{etag}'
+        content = cache.get(cache_key)
+        if content is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            cache.set(cache_key, content, settings.CATALOG_CACHE_TIMEOUT)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
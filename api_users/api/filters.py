@@ -1,41 +1,76 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from rest_framework.validators import qs_filter
 
 from recipes.models import FavoriteList, Recipe, ShoppingCart
+from recipes.search import search_recipes
+
+
+class MultipleCharField(forms.MultipleChoiceField):
+    """Список строк без проверки по вариантам выбора."""
+
+    def valid_value(self, value):
+        return True
+
+
+class MultipleCharFilter(filters.MultipleChoiceFilter):
+    """Фильтр по нескольким значениям параметра (?tags=a&tags=b)."""
+    field_class = MultipleCharField
 
 
 class RecipesFilters(filters.FilterSet):
-    """Фильтр для модели Recipe."""
+    """
+    Фильтр для модели Recipe.
+    Условия - подзапросы IN и EXISTS без соединений,
+    поэтому фильтры сочетаются в одном запросе без DISTINCT.
+    Поиск ?search= упорядочивает рецепты по релевантности.
+    """
     author = filters.NumberFilter(field_name='author')
-    tags = filters.CharFilter(field_name='tag__slug')
-    is_favorite = filters.CharFilter(method='get_is_favorite')
-    is_in_shopping_cart = filters.CharFilter(method='get_is_in_shopping_cart')
+    tags = MultipleCharFilter(field_name='tags__slug', method='get_tags')
+    is_favorite = filters.BooleanFilter(method='get_is_favorite')
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='get_is_in_shopping_cart'
+    )
+    search = filters.CharFilter(method='get_search')
 
     def get_filtered_recipes(self, queryset, checked_queryset, value):
         user = getattr(self.request, 'user', None)
-        if user is None or value not in ('0', '1'):
+        if value is None:
             return queryset
-        filtred_recipes = qs_filter(checked_queryset, user=user)
-        if bool(int(value)):
-            queryset.filter(
-                id__in=[recipe.id for recipe in filtred_recipes]
-            )
-        else:
-            queryset.exclude(
-                id__in=[recipe.id for recipe in filtred_recipes]
-            )
-        return queryset
+        if user is None or not user.is_authenticated:
+            return queryset.none() if value else queryset
+        if value:
+            # Рецепты пользователя выбираются по индексу (user, recipe),
+            # а не проверкой каждого рецепта.
+            return queryset.filter(pk__in=checked_queryset.filter(
+                user=user
+            ).values('recipe'))
+        return queryset.exclude(Exists(checked_queryset.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value
+        )))
 
     def get_is_favorite(self, queryset, name, value):
-        return self.get_filtred_recipes(
+        return self.get_filtered_recipes(
             queryset, FavoriteList.objects, value
         )
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        return self.get_filtred_recipes(
+        return self.get_filtered_recipes(
             queryset, ShoppingCart.objects, value
         )
 
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
-        fields = ('is_favorite', 'is_in_shopping_cart', 'author', 'tags')
+        fields = (
+            'is_favorite', 'is_in_shopping_cart', 'author', 'tags', 'search'
+        )
@@ -0,0 +1,116 @@
+import asyncio
+import statistics
+import time
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+
+from api_users.asgi import AsyncURLConfHandler
+
+
+def get_scope(path, query_string, headers):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+async def call(application, scope):
+    """Один запрос к приложению ASGI, возвращает статус ответа."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+async def run_level(application, scope, concurrency, total):
+    """
+    total запросов, не более concurrency одновременно.
+    Возвращает общее время, задержки запросов и статусы.
+    """
+    latencies = []
+    statuses = set()
+    queue = iter(range(total))
+
+    async def worker():
+        for _ in queue:
+            started = time.perf_counter()
+            statuses.add(await call(application, dict(scope)))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, statuses
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов в секунду на чтение под ASGI: '
+        'синхронные представления и ASGI_URLCONF с пулом потоков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default='/api/recipes/', help='Адрес запроса.'
+        )
+        parser.add_argument(
+            '--query', default='', help='Строка запроса без "?".'
+        )
+        parser.add_argument(
+            '--token', default='', help='Токен пользователя.'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[100, 1000],
+            help='Числа одновременных соединений.'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Число запросов на каждый уровень.'
+        )
+
+    def handle(self, *args, **options):
+        headers = []
+        if options['token']:
+            headers.append(
+                (b'authorization', f'Token {options["token"]}'.encode())
+            )
+        scope = get_scope(options['path'], options['query'], headers)
+        applications = (
+            ('sync', ASGIHandler()),
+            ('async', AsyncURLConfHandler()),
+        )
+        for concurrency in options['concurrency']:
+            total = max(options['requests'], concurrency)
+            for name, application in applications:
+                elapsed, latencies, statuses = asyncio.run(run_level(
+                    application, scope, concurrency, total
+                ))
+                latencies.sort()
+                p50 = statistics.median(latencies) * 1000
+                p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+                self.stdout.write(
+                    f'{name:>5} c={concurrency:<5} '
+                    f'rps={total / elapsed:8.1f} '
+                    f'p50={p50:7.1f}ms p99={p99:7.1f}ms '
+                    f'status={sorted(statuses)}'
+                )
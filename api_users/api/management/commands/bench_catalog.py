@@ -0,0 +1,84 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from recipes.models import Ingridient, Tag
+from recipes.validators import normalize_name
+
+# Режимы: без кэша, из кэша по версии, 304 по If-None-Match.
+MODES = ('cold', 'warm', '304')
+
+
+def generate_catalog(tags_count, ingridients_count):
+    Tag.objects.bulk_create([
+        Tag(name=f'Тэг {i}', slug=f'tag{i}', color='#FFFFFF')
+        for i in range(tags_count)
+    ])
+    names = [f'Ингридиент {i}' for i in range(ingridients_count)]
+    Ingridient.objects.bulk_create([
+        Ingridient(name=name, search_name=normalize_name(name))
+        for name in names
+    ])
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов в секунду к /api/tags/ и '
+        '/api/ingridients/ без кэша, из кэша и с ответом 304 '
+        'на сгенерированной тестовой базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tags', type=int, default=50, help='Число тэгов.'
+        )
+        parser.add_argument(
+            '--ingridients',
+            type=int,
+            default=2000,
+            help='Число ингридиентов.'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Число запросов на каждый режим.'
+        )
+
+    def handle(self, *args, **options):
+        # Справочники генерируются в тестовой базе, рабочая не меняется.
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            generate_catalog(options['tags'], options['ingridients'])
+            for path in ('/api/tags/', '/api/ingridients/'):
+                for mode in MODES:
+                    rps, status = self.measure(
+                        path, mode, options['requests']
+                    )
+                    self.stdout.write(
+                        f'{path:<18} {mode:>4} rps={rps:9.1f} '
+                        f'status={status}'
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def measure(path, mode, total):
+        """Запросов в секунду и статус последнего ответа."""
+        client = Client(HTTP_HOST='localhost')
+        cache.clear()
+        headers = {}
+        etag = client.get(path)['ETag']
+        if mode == '304':
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        started = time.perf_counter()
+        for _ in range(total):
+            if mode == 'cold':
+                cache.clear()
+            response = client.get(path, **headers)
+        return total / (time.perf_counter() - started), response.status_code
@@ -0,0 +1,168 @@
+import statistics
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from rest_framework.pagination import Cursor
+
+from api.pagination import CursorPagination
+from recipes.models import (
+    Ingridient, MeasurementUnit, Recipe, RecipeIngridient, Tag, User
+)
+from recipes.validators import DEFAULT_LIST_LIMIT, IMPORT_BATCH_SIZE
+
+
+def generate_recipes(count, batch_size):
+    """Автор, тэг, два ингридиента и count рецептов без сигналов."""
+    unit, _ = MeasurementUnit.objects.get_or_create(name='грамм')
+    author = User.objects.create_user(
+        email='bench@bench.ru', username='bench', password='bench'
+    )
+    tag = Tag.objects.create(name='Тэг', slug='bench', color='#FFFFFF')
+    Ingridient.objects.bulk_create([
+        Ingridient(name='Мука'), Ingridient(name='Сахар')
+    ])
+    ingridients = list(Ingridient.objects.filter(
+        name__in=('Мука', 'Сахар')
+    ))
+    Tags = Recipe.tags.through
+    for start in range(0, count, batch_size):
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image='recipes/images/bench.png'
+            )
+            for i in range(start, min(start + batch_size, count))
+        ])
+    for start in range(0, count, batch_size):
+        ids = list(Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        )[start:start + batch_size])
+        Tags.objects.bulk_create([
+            Tags(recipe_id=id, tag_id=tag.id) for id in ids
+        ])
+        RecipeIngridient.objects.bulk_create([
+            RecipeIngridient(
+                recipe_id=id, ingridient=ingridient,
+                amount=100, measurement_unit=unit
+            )
+            for id in ids for ingridient in ingridients
+        ])
+
+
+def get_cursor(position):
+    """Значение ?cursor= для рецептов с id меньше position."""
+    pagination = CursorPagination()
+    pagination.base_url = '/'
+    pagination.cursor_query_param = CursorPagination.cursor_query_param
+    url = pagination.encode_cursor(Cursor(
+        offset=0, reverse=False, position=str(position)
+    ))
+    return parse_qs(urlsplit(url).query)[pagination.cursor_query_param][0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время глубоких страниц /api/recipes/ '
+        'с ?page= и с ?cursor= на сгенерированной тестовой базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100000,
+            help='Число сгенерированных рецептов.'
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            nargs='+',
+            default=[1, 100, 1000, 10000],
+            help='Номера страниц для сравнения.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=DEFAULT_LIST_LIMIT,
+            help='Число рецептов на странице.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Число запросов на каждую страницу.'
+        )
+
+    def handle(self, *args, **options):
+        # Рецепты генерируются в тестовой базе, рабочая не меняется.
+        # Тестовая база SQLite находится в памяти: время чтения с диска
+        # в результаты не входит.
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            started = time.perf_counter()
+            generate_recipes(options['recipes'], IMPORT_BATCH_SIZE)
+            self.stdout.write(
+                f'Generated {options["recipes"]} recipes in '
+                f'{time.perf_counter() - started:.1f} s.'
+            )
+            self.compare(options['pages'], options['limit'], options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def compare(self, pages, limit, options):
+        client = Client(HTTP_HOST='localhost')
+        ids = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ))
+        for page in pages:
+            offset = (page - 1) * limit
+            if offset >= len(ids):
+                self.stderr.write(f'page={page}: no recipes.')
+                continue
+            cursor = get_cursor(ids[offset - 1]) if offset else ''
+            for name, params in (
+                ('page', {'page': page, 'limit': limit}),
+                ('cursor', {'cursor': cursor, 'limit': limit}),
+            ):
+                timings, sql_timings, first_id = self.measure(
+                    client, params, options['repeat']
+                )
+                if first_id != ids[offset]:
+                    self.stderr.write(
+                        f'{name}: first recipe {first_id}, '
+                        f'expected {ids[offset]}.'
+                    )
+                self.stdout.write(
+                    f'page={page:<6} {name:>6} '
+                    f'total={statistics.median(timings) * 1000:8.2f}ms '
+                    f'sql={statistics.median(sql_timings) * 1000:8.2f}ms'
+                )
+
+    @staticmethod
+    def measure(client, params, repeat):
+        """
+        Время запросов страницы, время SQL в них
+        и id первого рецепта страницы.
+        """
+        timings = []
+        sql_timings = []
+
+        def time_sql(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                sql_timings[-1] += time.perf_counter() - started
+
+        with connection.execute_wrapper(time_sql):
+            for _ in range(repeat):
+                sql_timings.append(0)
+                started = time.perf_counter()
+                response = client.get('/api/recipes/', params)
+                timings.append(time.perf_counter() - started)
+        return timings, sql_timings, response.json()['results'][0]['id']
@@ -0,0 +1,47 @@
+import io
+import pstats
+
+from django.core.management.base import BaseCommand
+
+from api.profiling import group_profiles
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединяет сохранённые профили запросов и выводит самые '
+        'затратные функции по каждому представлению.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views',
+            nargs='*',
+            help='Представления, например RecipeViewSet.list.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Число функций в отчёте по представлению.'
+        )
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            help='Ключ сортировки pstats.'
+        )
+
+    def handle(self, *args, **options):
+        groups = group_profiles()
+        views = options['views'] or sorted(groups)
+        for view in views:
+            files = groups.get(view)
+            if not files:
+                self.stderr.write(f'{view}: no profiles.')
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{view}: {len(files)} profiles'
+            ))
+            report = io.StringIO()
+            stats = pstats.Stats(*files, stream=report)
+            stats.sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write(report.getvalue())
@@ -0,0 +1,168 @@
+import asyncio
+import cProfile
+import logging
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachingTokenAuthentication
+from .profiling import get_profile_path, rotate_profiles
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """Число и время SQL-запросов одного HTTP-запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def repeats(self):
+        """Наибольшее число повторов одного запроса - признак N+1."""
+        if not self.statements:
+            return 0
+        return max(self.statements.values())
+
+
+def get_view_name(request):
+    """Имя представления DRF и действия: RecipeViewSet.list."""
+    match = request.resolver_match
+    if match is None:
+        return '-'
+    view = match.func
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return match.view_name or '-'
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    if action is None:
+        return cls.__name__
+    return f'{cls.__name__}.{action}'
+
+
+class QueryTimingMiddleware:
+    """
+    Считает SQL-запросы и время их выполнения для каждого запроса.
+    Итоги по представлению и действию уходят в заголовок Server-Timing
+    и в журнал api.middleware; запросы, сделавшие больше
+    QUERY_COUNT_THRESHOLD обращений к базе, пишутся с уровнем WARNING.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Под ASGI запросы к базе выполняются в потоках представлений,
+            # счётчик подключает api.async_views.run_view.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        return self.report(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.report(request, response, stats, start)
+
+    def report(self, request, response, stats, start):
+        total = time.perf_counter() - start
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+            f'app;dur={total * 1000:.1f}'
+        )
+        view = get_view_name(request)
+        slow = stats.count > settings.QUERY_COUNT_THRESHOLD
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            'view=%s method=%s path=%s status=%s queries=%d repeats=%d '
+            'db_ms=%.1f total_ms=%.1f',
+            view, request.method, request.path, response.status_code,
+            stats.count, stats.repeats, stats.duration * 1000, total * 1000,
+            extra={
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': stats.count,
+                'repeats': stats.repeats,
+                'db_ms': round(stats.duration * 1000, 1),
+                'total_ms': round(total * 1000, 1),
+                'too_many_queries': slow,
+            }
+        )
+        return response
+
+
+def is_staff(request):
+    """Сотрудник по сессии или по токену API."""
+    if request.user.is_staff:
+        return True
+    try:
+        result = CachingTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return result is not None and result[0].is_staff
+
+
+class ProfilingMiddleware:
+    """
+    Выполняет запрос под cProfile и сохраняет профиль в PROFILE_DIR.
+    Профилируется доля PROFILE_SAMPLE_RATE запросов и, если включён
+    PROFILE_ON_DEMAND, запросы сотрудников с заголовком X-Profile
+    или параметром ?profile. Если оба режима выключены,
+    промежуточный слой не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_SAMPLE_RATE and not settings.PROFILE_ON_DEMAND:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def is_requested(self, request):
+        if not settings.PROFILE_ON_DEMAND:
+            return False
+        if 'X-Profile' not in request.headers and 'profile' not in request.GET:
+            return False
+        return is_staff(request)
+
+    def __call__(self, request):
+        if not (
+            random.random() < settings.PROFILE_SAMPLE_RATE
+            or self.is_requested(request)
+        ):
+            return self.get_response(request)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        profile.dump_stats(get_profile_path(get_view_name(request)))
+        rotate_profiles()
+        return response
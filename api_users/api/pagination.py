@@ -1,6 +1,49 @@
 from rest_framework import pagination
 
+from recipes.validators import DEFAULT_LIST_LIMIT, MAX_LIST_LIMIT
+
 
 class PageNumberPagination(pagination.PageNumberPagination):
     page_query_param = 'page'
     page_size_query_param = 'limit'
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Пагинация по ключу: WHERE id < последний id ORDER BY id DESC LIMIT n.
+    Глубина страницы не влияет на время запроса, COUNT(*) не выполняется.
+    Порядок берётся из атрибута cursor_ordering вьюсета.
+    """
+    page_size = DEFAULT_LIST_LIMIT
+    page_size_query_param = 'limit'
+    max_page_size = MAX_LIST_LIMIT
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+
+class PageNumberOrCursorPagination(PageNumberPagination):
+    """
+    Постраничная пагинация (page/limit),
+    с параметром ?cursor= - пагинация по ключу.
+    """
+    cursor_pagination_class = CursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_pagination = self.cursor_pagination_class()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
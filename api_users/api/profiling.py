@@ -0,0 +1,40 @@
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+PROFILE_SUFFIX = '.pstats'
+
+
+def get_profile_path(view):
+    """Файл профиля: <представление>.<время>.<процесс>.pstats."""
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f'{view}.{time.time_ns()}.{os.getpid()}{PROFILE_SUFFIX}'
+
+
+def get_profile_files():
+    directory = Path(settings.PROFILE_DIR)
+    if not directory.is_dir():
+        return []
+    return sorted(
+        directory.glob(f'*{PROFILE_SUFFIX}'),
+        key=lambda path: path.name.rsplit('.', 3)[1]
+    )
+
+
+def rotate_profiles():
+    """Оставляет PROFILE_MAX_FILES последних профилей."""
+    files = get_profile_files()
+    for path in files[:max(len(files) - settings.PROFILE_MAX_FILES, 0)]:
+        path.unlink(missing_ok=True)
+
+
+def group_profiles():
+    """Файлы профилей по представлениям."""
+    groups = defaultdict(list)
+    for path in get_profile_files():
+        groups[path.name.rsplit('.', 3)[0]].append(str(path))
+    return groups
@@ -0,0 +1,200 @@
+import csv
+
+from rest_framework import renderers
+
+
+SHOPPING_LIST_FILENAME = 'shopping_list'
+PDF_ENCODING = 'cp1251'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 16
+PDF_LINES_PER_PAGE = 45
+PDF_PAGE_HEIGHT = 842
+PDF_PAGE_WIDTH = 595
+PDF_MARGIN = 56
+UPPER_CYRILLIC = 'АБВГДЕЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+LOWER_CYRILLIC = 'абвгдежзийклмнопрстуфхцчшщъыьэюя'
+
+
+class Echo:
+    """Псевдо-буфер: возвращает записанную строку вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    Строки списка - кортежи (наименование, количество, единица измерения).
+    Метод stream отдаёт файл по частям, не собирая его в памяти.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Ошибки (401, 404 и т.п.) отдаются обычным текстом.
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = 'text/plain; charset=utf-8'
+            return '\n'.join(
+                f'{key}: {value}' for key, value in data.items()
+            ).encode('utf-8')
+        return b''.join(self.stream(data))
+
+    def stream(self, rows):
+        raise NotImplementedError('Renderer class requires .stream()')
+
+    def get_filename(self):
+        return f'{SHOPPING_LIST_FILENAME}.{self.format}'
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате TXT."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for name, amount, measurement_unit in rows:
+            yield f'{name} ({measurement_unit}) - {amount}\n'.encode(
+                self.charset
+            )
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'amount', 'measurement_unit')
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header).encode(self.charset)
+        for row in rows:
+            yield writer.writerow(row).encode(self.charset)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """
+    Список покупок в формате PDF.
+    Документ пишется постранично, смещения объектов для таблицы xref
+    подсчитываются по мере отдачи. Кириллица кодируется в cp1251
+    через таблицу /Differences стандартного шрифта Helvetica.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    # Номера объектов, которые пишутся в конце документа.
+    PAGES_OBJECT = 1
+    CATALOG_OBJECT = 2
+    FONT_OBJECT = 3
+    FIRST_PAGE_OBJECT = 4
+
+    def stream(self, rows):
+        offsets = {}
+        page_objects = []
+        position = 0
+
+        def write_object(number, body):
+            nonlocal position
+            offsets[number] = position
+            chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+            position += len(chunk)
+            return chunk
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position += len(header)
+        yield header
+
+        next_object = self.FIRST_PAGE_OBJECT
+        for lines in self.paginate(rows):
+            content = self.get_page_content(lines)
+            yield write_object(
+                next_object,
+                b'<< /Length %d >>\nstream\n' % len(content)
+                + content + b'\nendstream'
+            )
+            yield write_object(
+                next_object + 1,
+                b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 %d 0 R >> >> '
+                b'/Contents %d 0 R >>' % (
+                    self.PAGES_OBJECT, PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT,
+                    self.FONT_OBJECT, next_object
+                )
+            )
+            page_objects.append(next_object + 1)
+            next_object += 2
+
+        kids = b' '.join(b'%d 0 R' % number for number in page_objects)
+        yield write_object(
+            self.PAGES_OBJECT,
+            b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                kids, len(page_objects)
+            )
+        )
+        yield write_object(
+            self.CATALOG_OBJECT,
+            b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES_OBJECT
+        )
+        yield write_object(self.FONT_OBJECT, self.get_font())
+
+        xref = [b'xref\n0 %d\n' % next_object, b'0000000000 65535 f \n']
+        xref.extend(
+            b'%010d 00000 n \n' % offsets[number]
+            for number in range(1, next_object)
+        )
+        xref.append(
+            b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (next_object, self.CATALOG_OBJECT, position)
+        )
+        yield b''.join(xref)
+
+    def paginate(self, rows):
+        """Разбивает строки списка на страницы, хотя бы одна страница."""
+        lines = []
+        pages_count = 0
+        for name, amount, measurement_unit in rows:
+            lines.append(f'{name} ({measurement_unit}) - {amount}')
+            if len(lines) == PDF_LINES_PER_PAGE:
+                pages_count += 1
+                yield lines
+                lines = []
+        if lines or not pages_count:
+            yield lines
+
+    def get_page_content(self, lines):
+        content = [
+            b'BT /F1 %d Tf %d TL %d %d Td' % (
+                PDF_FONT_SIZE, PDF_LINE_HEIGHT,
+                PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN
+            )
+        ]
+        for line in lines:
+            content.append(b'(%s) Tj T*' % self.escape(line))
+        content.append(b'ET')
+        return b'\n'.join(content)
+
+    @staticmethod
+    def escape(line):
+        encoded = line.encode(PDF_ENCODING, errors='replace')
+        return (
+            encoded.replace(b'\\', b'\\\\')
+            .replace(b'(', b'\\(')
+            .replace(b')', b'\\)')
+        )
+
+    @staticmethod
+    def get_font():
+        upper = ' '.join(
+            f'/afii{10017 + i + (i >= 6)}' for i in range(len(UPPER_CYRILLIC))
+        )
+        lower = ' '.join(
+            f'/afii{10065 + i + (i >= 6)}' for i in range(len(LOWER_CYRILLIC))
+        )
+        differences = f'168 /afii10023 184 /afii10071 192 {upper} {lower}'
+        return (
+            '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            '/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            f'/Differences [{differences}] >> >>'
+        ).encode('ascii')
@@ -1,8 +1,17 @@
 import base64
+import io
 
+from django.conf import settings as django_settings
 from django.utils.translation import gettext_lazy as _
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.utils.text import format_lazy as _f
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile, TemporaryUploadedFile
+)
+from django.db import transaction
+from django.db.models import (
+    F, Prefetch, Window, prefetch_related_objects
+)
+from django.db.models.functions import RowNumber
 from djoser.conf import settings
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
@@ -11,10 +20,77 @@ from rest_framework.validators import (
     UniqueTogetherValidator, qs_exists, qs_filter
 )
 
+from recipes.images import get_variant_name
 from recipes.models import (
-    FavoriteList, Ingridient, Recipe, ShoppingCart, Subscribe, Tag, User
+    FavoriteList, Ingridient, Recipe, RecipeIngridient, ShoppingCart,
+    Subscribe, Tag, User
 )
-from recipes.validators import DEFAULT_LIST_LIMIT
+from recipes.shopping_list import refresh_recipes
+from recipes.sql import delete_rows
+from recipes.validators import (
+    BASE64_CHUNK_SIZE, BASE64_MARKER, DEFAULT_LIST_LIMIT, IMAGE_SIGNATURES,
+    IMAGE_VARIANTS, MAX_BATCH_SIZE, MAX_DATA_URI_HEADER, MAX_LIST_LIMIT,
+    amount_validator
+)
+
+
+class FollowedAuthors:
+    """
+    Id авторов, на которых подписан пользователь запроса.
+    Хранится в запросе и догружается только для ещё не проверенных id,
+    для анонимного пользователя запросов нет.
+    """
+    attribute_name = '_followed_authors'
+
+    def __init__(self, follower):
+        self.follower = follower
+        self.checked = set()
+        self.followed = set()
+
+    @classmethod
+    def for_request(cls, request):
+        followed_authors = getattr(request, cls.attribute_name, None)
+        if followed_authors is None:
+            followed_authors = cls(request.user)
+            setattr(request, cls.attribute_name, followed_authors)
+        return followed_authors
+
+    def load(self, author_ids):
+        missing = set(author_ids) - self.checked
+        if missing and self.follower.is_authenticated:
+            self.followed.update(Subscribe.objects.filter(
+                follower=self.follower, author__in=missing
+            ).values_list('author_id', flat=True))
+        self.checked.update(missing)
+
+    def add(self, author_id):
+        self.checked.add(author_id)
+        self.followed.add(author_id)
+
+    def discard(self, author_id):
+        self.checked.add(author_id)
+        self.followed.discard(author_id)
+
+    def __contains__(self, author_id):
+        self.load((author_id,))
+        return author_id in self.followed
+
+
+class UserListSerializer(serializers.ListSerializer):
+    """
+    Для чтения списка пользователей.
+    Подписки на всех пользователей страницы загружаются одним запросом.
+    """
+
+    def to_representation(self, data):
+        users = list(data)
+        request = self.context.get('request')
+        if request is not None:
+            FollowedAuthors.for_request(request).load(
+                user.id for user in users
+                if not hasattr(user, 'is_subscribed')
+            )
+        return super().to_representation(users)
 
 
 class UserSerializer(DjoserUserSerializer):
@@ -26,28 +102,125 @@ class UserSerializer(DjoserUserSerializer):
         fields = tuple(User.REQUIRED_FIELDS) + (
             settings.USER_ID_FIELD,
             settings.LOGIN_FIELD,
-            'is_subscribed'
+            'is_subscribed',
+            'recipes_count',
+            'followers_count'
         )
         read_only_fields = (settings.LOGIN_FIELD,)
+        list_serializer_class = UserListSerializer
     
     def get_is_subscribed(self, author):
-        follower = self.context['request'].user
-        return qs_exists(qs_filter(
-            Subscribe.objects, author=author, follower=follower
-        ))
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        request = self.context.get('request')
+        if request is None:
+            return False
+        return author.id in FollowedAuthors.for_request(request)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии изображения рецепта.
+    Пока копии не созданы (rendered_image не совпадает с image),
+    отдаётся ссылка на оригинал; хранилище не опрашивается.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        image = recipe.image
+        if not image:
+            return None
+        request = self.context.get('request')
+        rendered = recipe.rendered_image == image.name
+        urls = {}
+        for variant in IMAGE_VARIANTS:
+            if rendered:
+                url = image.storage.url(get_variant_name(image.name, variant))
+            else:
+                url = image.url
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant] = url
+        return urls
 
 
 class SimpleRecipeSerializer(serializers.ModelSerializer):
     """Для чтения рецептов блюд."""
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+def get_limit(request, query_param):
+    """
+    Ограничение числа строк из параметра запроса.
+    Отрицательные и нечисловые значения отклоняются,
+    большие ограничиваются MAX_LIST_LIMIT.
+    """
+    value = request.query_params.get(query_param, DEFAULT_LIST_LIMIT)
+    field = serializers.IntegerField(min_value=0)
+    try:
+        limit = field.run_validation(value)
+    except ValidationError as error:
+        raise ValidationError({query_param: error.detail})
+    return min(limit, MAX_LIST_LIMIT)
+
+
+def get_recipes_limit(request):
+    """Параметр recipes_limit из запроса."""
+    return get_limit(request, 'recipes_limit')
+
+
+class UserRecipesListSerializer(UserListSerializer):
+    """
+    Для чтения списка пользователей с рецептами блюд.
+    Первые recipes_limit рецептов всех авторов страницы выбираются
+    одним запросом с ROW_NUMBER() OVER (PARTITION BY author_id).
+    """
+
+    def to_representation(self, data):
+        authors = list(data)
+        if authors:
+            self.prefetch_recipes(authors)
+        return super().to_representation(authors)
+
+    def prefetch_recipes(self, authors):
+        recipes_limit = get_recipes_limit(self.context['request'])
+        ranked = Recipe.objects.filter(
+            author__in=authors
+        ).only(
+            'id', 'name', 'image', 'rendered_image', 'cooking_time', 'author'
+        ).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=F('id').desc()
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked_recipes '
+            'WHERE row_number <= %s ORDER BY author_id, row_number',
+            params + (recipes_limit,)
+        )
+        recipes_by_author = {author.id: [] for author in authors}
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_preview = recipes_by_author[author.id]
 
 
 class UserRecipesSerializer(UserSerializer):
-    """Для чтения пользователей с рецептами блюд."""
-    recipes_count = serializers.SerializerMethodField()
+    """
+    Для чтения пользователей с рецептами блюд.
+    Аннотация is_subscribed и подготовленный recipes_preview
+    используются, если они есть у объекта.
+    """
     recipes = serializers.SerializerMethodField()
     
     class Meta:
@@ -57,23 +230,23 @@ class UserRecipesSerializer(UserSerializer):
             settings.LOGIN_FIELD,
             'is_subscribed',
             'recipes_count',
+            'followers_count',
             'recipes'
         )
         read_only_fields = (settings.LOGIN_FIELD,)
+        list_serializer_class = UserRecipesListSerializer
 
-    def get_recipes_count(self, author):
-        qs = qs_filter(Recipe.objects, author=author)
-        if qs_exists(qs):
-            return qs.count()
-        else:
-            return 0
-    
     def get_recipes(self, author):
-        recipes_limit = int(self.context['request'].query_params.get(
-            'recipes_limit', DEFAULT_LIST_LIMIT
-        ))
-        qs = qs_filter(Recipe.objects, author=author)[:recipes_limit]
-        serializer = SimpleRecipeSerializer(qs, many=True)
+        if hasattr(author, 'recipes_preview'):
+            recipes = author.recipes_preview
+        else:
+            recipes_limit = get_recipes_limit(self.context['request'])
+            recipes = qs_filter(
+                Recipe.objects, author=author
+            ).order_by('-id')[:recipes_limit]
+        serializer = SimpleRecipeSerializer(
+            recipes, many=True, context=self.context
+        )
         return serializer.data
 
 
@@ -107,15 +280,85 @@ class SubcribeSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для записи изображения."""
+    """
+    Поле для записи изображения в виде data URI.
+    Base64 декодируется частями: по первым байтам проверяется сигнатура
+    изображения, при превышении max_size разбор прекращается. Файлы больше
+    FILE_UPLOAD_MAX_MEMORY_SIZE пишутся во временный файл на диске.
+    """
+    default_error_messages = {
+        'invalid_base64': _('Image is not a valid base64 data URI.'),
+        'unknown_format': _('Uploaded data is not a supported image.'),
+        'too_large': _('Image should not be larger than {max_size} bytes.'),
+    }
+    chunk_size = BASE64_CHUNK_SIZE
+
+    def __init__(self, *args, **kwargs):
+        self.max_size = kwargs.pop(
+            'max_size', django_settings.RECIPE_IMAGE_MAX_SIZE
+        )
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imagestr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imagestr), name='image.' + ext)
-
+            data = self.decode(data)
         return super().to_internal_value(data)
 
+    @staticmethod
+    def get_extension(head):
+        for signature, ext in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return ext
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'webp'
+        return None
+
+    def decode(self, data):
+        start = data.find(BASE64_MARKER, 0, MAX_DATA_URI_HEADER)
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(BASE64_MARKER)
+        buffer = io.BytesIO()
+        upload = None
+        ext = None
+        size = 0
+        carry = ''
+        for position in range(start, len(data), self.chunk_size):
+            chunk = carry + ''.join(
+                data[position:position + self.chunk_size].split()
+            )
+            aligned = len(chunk) // 4 * 4
+            chunk, carry = chunk[:aligned], chunk[aligned:]
+            try:
+                decoded = base64.b64decode(chunk, validate=True)
+            except ValueError:
+                self.fail('invalid_base64')
+            if ext is None:
+                ext = self.get_extension(decoded)
+                if ext is None:
+                    self.fail('unknown_format')
+            size += len(decoded)
+            if size > self.max_size:
+                self.fail('too_large', max_size=self.max_size)
+            if (upload is None
+                    and size > django_settings.FILE_UPLOAD_MAX_MEMORY_SIZE):
+                upload = TemporaryUploadedFile(
+                    f'image.{ext}', f'image/{ext}', 0, None
+                )
+                upload.write(buffer.getvalue())
+                buffer = None
+            (buffer if upload is None else upload).write(decoded)
+        if carry or ext is None:
+            self.fail('invalid_base64')
+        if upload is None:
+            upload = InMemoryUploadedFile(
+                buffer, None, f'image.{ext}', f'image/{ext}', size, None
+            )
+        else:
+            upload.size = size
+        upload.seek(0)
+        return upload
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Для чтения тэгов-категорий рецептов."""
@@ -130,69 +373,186 @@ class IngridientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ingridient
-        fields = '__all__'
+        fields = ('id', 'name')
+
+
+class WriteRecipeIngridientSerializer(serializers.Serializer):
+    """Для записи ингридиента в рецепт."""
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(validators=[amount_validator])
 
 
 class WriteRecipeSerializer(serializers.ModelSerializer):
-    """Для записи рецептов."""
+    """
+    Для записи рецептов.
+    Тэги и ингридиенты проверяются одним запросом IN на модель,
+    строки RecipeIngridient пишутся пакетно в одной транзакции.
+    """
     image = Base64ImageField()
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingridients = WriteRecipeIngridientSerializer(many=True)
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        fields = (
+            'id', 'tags', 'ingridients', 'image', 'name', 'text',
+            'cooking_time'
+        )
+
+    @staticmethod
+    def check_ids(model, ids):
+        """Список id без повторов; все id должны быть в базе."""
+        unique_ids = list(dict.fromkeys(ids))
+        found_ids = set(model.objects.filter(
+            id__in=unique_ids
+        ).values_list('id', flat=True))
+        missing_ids = [id for id in unique_ids if id not in found_ids]
+        if missing_ids:
+            raise ValidationError(_f(
+                'Objects with id {ids} do not exist.',
+                ids=', '.join(map(str, missing_ids))
+            ))
+        return unique_ids
+
+    def validate_tags(self, tags):
+        return self.check_ids(Tag, tags)
+
+    def validate_ingridients(self, ingridients):
+        ids = [ingridient['id'] for ingridient in ingridients]
+        if len(set(ids)) != len(ids):
+            raise ValidationError(
+                _('Ingridients in recipe should not be repeated.')
+            )
+        self.check_ids(Ingridient, ids)
+        return ingridients
 
+    @transaction.atomic
     def create(self, validated_data):
         ingridients = validated_data.pop('ingridients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for tag in tags:
-            current_tag = get_object_or_404(Tag, **tag)
-            recipe.tags.create(tag=current_tag)
-        for ingridient in ingridients:
-            amount = ingridient.pop('amount')
-            current_ingridient = get_object_or_404(Ingridient, **ingridient)
-            recipe.ingridients.create(
-                ingridient=current_ingridient, amount=amount
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+            for tag_id in tags
+        ])
+        RecipeIngridient.objects.bulk_create([
+            RecipeIngridient(
+                recipe=recipe,
+                ingridient_id=ingridient['id'],
+                amount=ingridient['amount']
             )
-
+            for ingridient in ingridients
+        ])
         return recipe
-    
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        ingridients = validated_data.pop('ingridients')
-        tags = validated_data.pop('tags')
-        list_of_tags = [get_object_or_404(Tag, **tag) for tag in tags]
-        recipe.tags.set(list_of_tags)
-        for ingridient in ingridients:
-            amount = ingridient.pop('amount')
-            current_ingridient = get_object_or_404(Ingridient, **ingridient)
-            recipe.ingridients.create_or_update(
-                ingridient=current_ingridient, amount=amount
+        ingridients = validated_data.pop('ingridients', None)
+        tags = validated_data.pop('tags', None)
+        recipe = super().update(recipe, validated_data)
+        if tags is not None:
+            recipe.tags.set(tags)
+        if ingridients is not None:
+            self.set_ingridients(recipe, ingridients)
+        return recipe
+
+    @staticmethod
+    def set_ingridients(recipe, ingridients):
+        amounts = {
+            ingridient['id']: ingridient['amount']
+            for ingridient in ingridients
+        }
+        current = {
+            recipe_ingridient.ingridient_id: recipe_ingridient
+            for recipe_ingridient in RecipeIngridient.objects.filter(
+                recipe=recipe
+            ).only('id', 'ingridient_id', 'amount')
+        }
+        # Удаляем лишние ингридиенты из рецепта одним DELETE без
+        # сигналов: рецепт уже сохранён (updated_at, поиск), списки
+        # покупок пересчитываются ниже один раз на рецепт.
+        deleted_ids = current.keys() - amounts.keys()
+        if deleted_ids:
+            delete_rows(
+                RecipeIngridient, recipe=recipe, ingridient=deleted_ids
+            )
+        changed = []
+        for ingridient_id, recipe_ingridient in current.items():
+            amount = amounts.get(ingridient_id)
+            if amount is not None and recipe_ingridient.amount != amount:
+                recipe_ingridient.amount = amount
+                changed.append(recipe_ingridient)
+        if changed:
+            RecipeIngridient.objects.bulk_update(changed, ['amount'])
+        RecipeIngridient.objects.bulk_create([
+            RecipeIngridient(
+                recipe=recipe, ingridient_id=ingridient_id, amount=amount
             )
-        # Удаляем лишние ингридиенты из рецепта.
-        deleted_ingridients = recipe.ingridients.exclude(
-            id__in=[ingridient.get('id',0) for ingridient in ingridients]
+            for ingridient_id, amount in amounts.items()
+            if ingridient_id not in current
+        ])
+        # Пакетные запросы не отправляют сигналы: списки покупок
+        # с этим рецептом пересчитываются по его ингридиентам.
+        refresh_recipes([recipe.pk], current.keys() | amounts.keys())
+
+    def to_representation(self, recipe):
+        prefetch_related_objects(
+            [recipe], *ReadRecipeSerializer.get_prefetch_lookups()
         )
-        if qs_exists(deleted_ingridients):
-            for deleted_ingridient in deleted_ingridients:
-                deleted_ingridient.delete()
+        return ReadRecipeSerializer(recipe, context=self.context).data
 
-        return recipe
+
+class RecipeIngridientSerializer(serializers.ModelSerializer):
+    """Для чтения ингридиентов в рецепте."""
+    id = serializers.ReadOnlyField(source='ingridient_id')
+    name = serializers.ReadOnlyField(source='ingridient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='measurement_unit.name'
+    )
+
+    class Meta:
+        model = RecipeIngridient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
 class ReadRecipeSerializer(serializers.ModelSerializer):
-    """Для чтения рецептов."""
+    """
+    Для чтения рецептов.
+    Флаги is_favorite и is_in_shopping_cart берутся из аннотаций
+    RecipeViewSet.get_queryset, запрос выполняется только без них.
+    """
     tags = TagSerializer(read_only=True, many=True)
-    ingridients = IngridientSerializer(read_only=True, many=True)
+    ingridients = RecipeIngridientSerializer(
+        source='recipes', read_only=True, many=True
+    )
     is_favorite = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = '__all__'
 
-    def check_query_set(self, recipe, query_set):
+    @staticmethod
+    def get_prefetch_lookups():
+        """Связи, которые нужно подгрузить заранее для чтения рецептов."""
+        return (
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=RecipeIngridient.objects.select_related(
+                    'ingridient', 'measurement_unit'
+                )
+            )
+        )
+
+    def check_query_set(self, recipe, query_set, annotation):
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
         user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
         return qs_exists(qs_filter(
             query_set, user=user, recipe=recipe
         ))
@@ -200,13 +560,15 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
     def get_is_favorite(self, recipe):
         return self.check_query_set(
             recipe=recipe,
-            query_set=FavoriteList.objects
+            query_set=FavoriteList.objects,
+            annotation='is_favorite'
         )
 
     def get_is_in_shopping_cart(self, recipe):
         return self.check_query_set(
             recipe=recipe,
-            query_set=ShoppingCart.objects
+            query_set=ShoppingCart.objects,
+            annotation='is_in_shopping_cart'
         )
 
     def get_image(self, recipe):
@@ -219,6 +581,12 @@ class FavoriteListSerializer(serializers.ModelSerializer):
     class Meta:
         model = FavoriteList
         fields = '__all__'
+        validators = [
+            UniqueTogetherValidator(
+                queryset=FavoriteList.objects,
+                fields=('user', 'recipe')
+            ),
+        ]
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -227,3 +595,18 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = '__all__'
+        validators = [
+            UniqueTogetherValidator(
+                queryset=ShoppingCart.objects,
+                fields=('user', 'recipe')
+            ),
+        ]
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления и удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
@@ -0,0 +1,35 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingridient, MeasurementUnit, Tag, User
+from .authentication import token_cache
+from .cache import bump_version, get_version_key
+
+
+@receiver(post_save, sender=Ingridient)
+@receiver(post_delete, sender=Ingridient)
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(post_delete, sender=MeasurementUnit)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_catalog_version(sender, **kwargs):
+    """Новая версия справочника - после фиксации транзакции."""
+    transaction.on_commit(partial(bump_version, get_version_key(sender)))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def discard_user_tokens(sender, instance, **kwargs):
+    """Смена пароля, блокировка и удаление пользователя."""
+    transaction.on_commit(partial(token_cache.discard_user, instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def discard_token(sender, instance, **kwargs):
+    """Выход: djoser удаляет токен пользователя."""
+    transaction.on_commit(partial(token_cache.discard, instance.key))
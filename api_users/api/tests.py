@@ -0,0 +1,948 @@
+import base64
+import re
+import shutil
+import tempfile
+import warnings
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.authentication import CachingTokenAuthentication, token_cache
+from api.serializers import Base64ImageField
+from api.management.commands.bench_asgi import get_scope
+from api_users import schema
+from api_users.asgi import application
+from recipes.models import (
+    FavoriteList, Ingridient, MeasurementUnit, Recipe, RecipeIngridient,
+    ShoppingCart, Subscribe, Tag, User
+)
+from recipes.shopping_list import get_differences
+from recipes.images import get_render_task, render_variants
+from recipes.signals import mark_image_rendered
+from recipes.tests import ImagePoolMixin
+from recipes.validators import (
+    DEFAULT_LIST_LIMIT, MAX_BATCH_SIZE, MAX_LIST_LIMIT
+)
+
+# Изображение 1x1 PNG для записи рецептов.
+PNG_DATA_URI = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+# Число запросов пакетного добавления и удаления при любой длине списка.
+BATCH_POST_QUERIES = 10
+BATCH_DELETE_QUERIES = 7
+# Обход таблицы в плане запроса: SCAN <таблица> [USING ... INDEX ...].
+PLAN_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)')
+# Допустимые обходы таблиц: таблица, шаблон SQL запроса и причина.
+ALLOWED_SCANS = (
+    (
+        'recipes_recipe', r'ORDER BY "recipes_recipe"\."id" DESC LIMIT \d+',
+        'страница рецептов: обход первичного ключа до LIMIT'
+    ),
+    (
+        'recipes_recipe', r'^SELECT MAX\(',
+        'ETag списка рецептов: агрегат по узкому индексу updated_at'
+    ),
+    (
+        'recipes_recipe', r'^SELECT COUNT\(\*\)',
+        'число рецептов для постраничной пагинации'
+    ),
+    (
+        'recipes_user', r'^SELECT COUNT\(\*\)',
+        'число пользователей для постраничной пагинации'
+    ),
+    (
+        'recipes_user', r' LIMIT \d+',
+        'страница пользователей'
+    ),
+    (
+        'recipes_tag', r'FROM "recipes_tag"$',
+        'справочник тэгов целиком, ответ кэшируется по версии'
+    ),
+    (
+        'recipes_ingridient', r'FROM "recipes_ingridient"( ORDER BY .*)?$',
+        'каталог ингридиентов целиком: ответ и индекс автодополнения '
+        'кэшируются по версии'
+    ),
+)
+
+
+def create_catalog(recipes_count=12, ingridients_count=4):
+    """Пользователи, тэги, ингридиенты и рецепты для тестов api."""
+    grams = MeasurementUnit.objects.create(name='грамм')
+    author = User.objects.create_user(
+        email='author@test.ru', username='author', password='password'
+    )
+    reader = User.objects.create_user(
+        email='reader@test.ru', username='reader', password='password'
+    )
+    tags = [
+        Tag.objects.create(name=f'Тэг {i}', slug=f'tag{i}', color='#FFFFFF')
+        for i in range(3)
+    ]
+    ingridients = [
+        Ingridient.objects.create(name=f'Ингридиент {i}')
+        for i in range(ingridients_count)
+    ]
+    recipes = []
+    for i in range(recipes_count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {i}', text='Текст',
+            cooking_time=10, image=f'recipes/images/recipe{i}.png'
+        )
+        recipe.tags.set(tags[:1 + i % len(tags)])
+        RecipeIngridient.objects.bulk_create([
+            RecipeIngridient(
+                recipe=recipe, ingridient=ingridient,
+                amount=j + 1, measurement_unit=grams
+            )
+            for j, ingridient in enumerate(ingridients)
+        ])
+        recipes.append(recipe)
+    for recipe in recipes[:3]:
+        FavoriteList.objects.create(user=reader, recipe=recipe)
+        ShoppingCart.objects.create(user=reader, recipe=recipe)
+    return author, reader, recipes
+
+
+class RecipeListQueriesTest(ImagePoolMixin, APITestCase):
+    """Число запросов страницы рецептов не зависит от её размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog()
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def get_query_count(self, path, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def assert_constant_queries(self, path, **params):
+        # Первый запрос заполняет кэш токенов и версий.
+        self.client.get(path, {'limit': 1, **params})
+        expected = self.get_query_count(path, limit=2, **params)
+        with self.assertNumQueries(expected):
+            response = self.client.get(path, {'limit': 10, **params})
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_anonymous_list(self):
+        self.assert_constant_queries('/api/recipes/')
+
+    def test_authenticated_list(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assert_constant_queries('/api/recipes/')
+
+    def test_cursor_list(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assert_constant_queries('/api/recipes/', cursor='')
+
+
+class RecipeConditionalTest(ImagePoolMixin, APITestCase):
+    """ETag рецептов: 304 без сериализации, избранное и корзина в ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog(recipes_count=5)
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def assert_not_modified(self, path, etag):
+        # Токен уже в кэше: остаётся один агрегирующий запрос.
+        with self.assertNumQueries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_not_modified(self):
+        recipe = self.recipes[-1]
+        for path in ('/api/recipes/', f'/api/recipes/{recipe.id}/'):
+            with self.subTest(path=path):
+                etag = self.client.get(path)['ETag']
+                self.assert_not_modified(path, etag)
+
+    def test_favorite_changes_etag(self):
+        recipe = self.recipes[-1]
+        path = f'/api/recipes/{recipe.id}/'
+        etag = self.client.get(path)['ETag']
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorite'])
+        self.assert_not_modified(path, response['ETag'])
+
+    def test_cart_changes_etag_without_signals(self):
+        """
+        Состояние корзины берётся из базы: строка, вставленная без
+        сигналов и счётчиков (как другим процессом), меняет ETag.
+        """
+        recipe = self.recipes[-1]
+        etag = self.client.get('/api/recipes/')['ETag']
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=self.reader, recipe=recipe)
+        ])
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()[0]['is_in_shopping_cart'])
+
+    def test_anonymous_last_modified(self):
+        self.client.credentials()
+        response = self.client.get('/api/recipes/')
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                '/api/recipes/',
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+        self.assertEqual(not_modified.status_code, 304)
+
+
+class IngridientSearchTest(ImagePoolMixin, APITestCase):
+    """Автодополнение ингридиентов: сначала начало названия, затем вхождение."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль', 'Ванильный сахар', 'Сахарная пудра', 'Сахар'):
+            Ingridient.objects.create(name=name)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_names(self, **params):
+        response = self.client.get('/api/ingridients/', params)
+        self.assertEqual(response.status_code, 200)
+        return [ingridient['name'] for ingridient in response.json()]
+
+    def test_prefix_before_substring(self):
+        for index_cache in (True, False):
+            with self.subTest(index_cache=index_cache), override_settings(
+                INGRIDIENT_INDEX_CACHE=index_cache
+            ):
+                self.assertEqual(
+                    self.get_names(name='САХ'),
+                    ['Сахар', 'Сахарная пудра', 'Ванильный сахар']
+                )
+                self.assertEqual(
+                    self.get_names(name='сахар', limit=2),
+                    ['Сахар', 'Сахарная пудра']
+                )
+
+    def test_index_cache_without_queries(self):
+        self.get_names(name='сах')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_names(name='соль'), ['Соль'])
+
+    def test_index_cache_refresh(self):
+        self.get_names(name='сах')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingridient.objects.create(name='Сахарин')
+        self.assertIn('Сахарин', self.get_names(name='сах'))
+
+
+class CatalogCacheTest(ImagePoolMixin, APITestCase):
+    """Ответы справочников из кэша по версии, 304 по ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_without_queries(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/tags/')
+            not_modified = self.client.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_version_bump(self):
+        response = self.client.get('/api/tags/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch')
+        changed = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(len(changed.json()), 2)
+
+    def test_token_is_not_checked(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        for accept in ('application/json', 'text/html'):
+            with self.subTest(accept=accept):
+                response = self.client.get('/api/tags/', HTTP_ACCEPT=accept)
+                self.assertEqual(response.status_code, 200)
+
+
+class RecipesFiltersTest(ImagePoolMixin, APITestCase):
+    """Фильтры списка рецептов по тэгам, автору, избранному и корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog(recipes_count=6)
+        cls.other = User.objects.create_user(
+            email='other@test.ru', username='other', password='password'
+        )
+        cls.other_recipe = Recipe.objects.create(
+            author=cls.other, name='Другой рецепт', text='Текст',
+            cooking_time=10, image='recipes/images/other.png'
+        )
+        cls.other_recipe.tags.set(Tag.objects.filter(slug='tag2'))
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.other_recipe)
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def get_ids(self, params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        ids = [recipe['id'] for recipe in response.json()]
+        self.assertEqual(len(ids), len(set(ids)))
+        return set(ids)
+
+    def get_recipe_ids(self, *indexes):
+        return {self.recipes[i].id for i in indexes}
+
+    def test_tags_and_author(self):
+        other_id = self.other_recipe.id
+        for params, expected in (
+            ({'tags': 'tag1'}, self.get_recipe_ids(1, 2, 4, 5)),
+            (
+                {'tags': ['tag1', 'tag2']},
+                self.get_recipe_ids(1, 2, 4, 5) | {other_id}
+            ),
+            ({'tags': 'missing'}, set()),
+            ({'author': self.other.id}, {other_id}),
+            (
+                {'author': self.author.id, 'tags': 'tag2'},
+                self.get_recipe_ids(2, 5)
+            ),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.get_ids(params), expected)
+
+    def test_user_lists(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        all_ids = self.get_recipe_ids(*range(6)) | {self.other_recipe.id}
+        for params, expected in (
+            ({'is_favorite': 1}, self.get_recipe_ids(0, 1, 2)),
+            (
+                {'is_favorite': 0},
+                self.get_recipe_ids(3, 4, 5) | {self.other_recipe.id}
+            ),
+            (
+                {'is_in_shopping_cart': 1},
+                self.get_recipe_ids(0, 1, 2) | {self.other_recipe.id}
+            ),
+            ({'is_in_shopping_cart': 0}, self.get_recipe_ids(3, 4, 5)),
+            (
+                {'is_favorite': 1, 'is_in_shopping_cart': 1, 'tags': 'tag1'},
+                self.get_recipe_ids(1, 2)
+            ),
+            ({'is_favorite': ''}, all_ids),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.get_ids(params), expected)
+
+    def test_user_lists_anonymous(self):
+        all_ids = self.get_recipe_ids(*range(6)) | {self.other_recipe.id}
+        for params, expected in (
+            ({'is_favorite': 1}, set()),
+            ({'is_in_shopping_cart': 1}, set()),
+            ({'is_favorite': 0}, all_ids),
+            (
+                {'is_in_shopping_cart': 0, 'tags': 'tag2'},
+                self.get_recipe_ids(2, 5) | {self.other_recipe.id}
+            ),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.get_ids(params), expected)
+
+
+class SubscriptionsTest(ImagePoolMixin, APITestCase):
+    """Подписки: параметр recipes_limit и первые рецепты авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.follower = User.objects.create_user(
+            email='follower@test.ru', username='follower', password='password'
+        )
+        cls.recipes = {}
+        for i, count in enumerate((0, 1, 3, MAX_LIST_LIMIT + 1, 2, 4)):
+            author = User.objects.create_user(
+                email=f'author{i}@test.ru', username=f'author{i}',
+                password='password'
+            )
+            Recipe.objects.bulk_create([
+                Recipe(
+                    author=author, name=f'Рецепт {j}', text='Текст',
+                    cooking_time=10, image='recipes/images/recipe.png'
+                )
+                for j in range(count)
+            ])
+            cls.recipes[author.id] = list(Recipe.objects.filter(
+                author=author
+            ).order_by('-id').values_list('id', flat=True))
+            Subscribe.objects.create(follower=cls.follower, author=author)
+        cls.token = Token.objects.create(user=cls.follower)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        # Токен попадает в кэш до подсчёта запросов.
+        token_cache.clear()
+        self.client.get('/api/users/me/')
+
+    def get_subscriptions(self, **params):
+        return self.client.get('/api/users/subscriptions/', params)
+
+    def get_previews(self, **params):
+        response = self.get_subscriptions(**params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {
+            author['id']: [recipe['id'] for recipe in author['recipes']]
+            for author in response.json()
+        }
+
+    def test_recipes_limit(self):
+        for recipes_limit, expected in (
+            (2, 2), (0, 0), (MAX_LIST_LIMIT * 2, MAX_LIST_LIMIT)
+        ):
+            with self.subTest(recipes_limit=recipes_limit):
+                self.assertEqual(
+                    self.get_previews(recipes_limit=recipes_limit),
+                    {
+                        author_id: ids[:expected]
+                        for author_id, ids in self.recipes.items()
+                    }
+                )
+
+    def test_default_recipes_limit(self):
+        self.assertEqual(self.get_previews(), {
+            author_id: ids[:DEFAULT_LIST_LIMIT]
+            for author_id, ids in self.recipes.items()
+        })
+
+    def test_invalid_recipes_limit(self):
+        for recipes_limit in (-1, 'two', ''):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.get_subscriptions(
+                    recipes_limit=recipes_limit
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes_limit', response.json())
+
+    def test_queries_do_not_depend_on_page_size(self):
+        counts = []
+        for limit in (2, len(self.recipes)):
+            with CaptureQueriesContext(connection) as context:
+                response = self.get_subscriptions(limit=limit, recipes_limit=3)
+            self.assertEqual(len(response.json()['results']), limit)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BatchActionTest(ImagePoolMixin, APITestCase):
+    """Пакетное добавление и удаление рецептов в списках."""
+
+    url = '/api/recipes/shopping_cart/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog(
+            recipes_count=35
+        )
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        # Токен попадает в кэш до подсчёта запросов.
+        token_cache.clear()
+        self.client.get('/api/users/me/')
+
+    def send(self, method, ids):
+        response = getattr(self.client, method)(
+            self.url, {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return [result['status'] for result in response.json()['results']]
+
+    def test_queries_do_not_depend_on_size(self):
+        for size in (10, 30):
+            ids = [recipe.id for recipe in self.recipes[3:3 + size]]
+            with self.subTest(size=size):
+                with self.assertNumQueries(BATCH_POST_QUERIES):
+                    self.assertEqual(
+                        self.send('post', ids), ['added'] * size
+                    )
+                with self.assertNumQueries(BATCH_DELETE_QUERIES):
+                    self.assertEqual(
+                        self.send('delete', ids), ['removed'] * size
+                    )
+        self.assertEqual(get_differences(), {})
+
+    def test_statuses(self):
+        missing = self.recipes[-1].id + 1
+        ids = [self.recipes[0].id, self.recipes[3].id, missing]
+        self.assertEqual(
+            self.send('post', ids), ['exists', 'added', 'not_found']
+        )
+        self.assertEqual(
+            self.send('delete', ids + [self.recipes[4].id]),
+            ['removed', 'removed', 'not_found', 'not_found']
+        )
+        self.assertFalse(ShoppingCart.objects.filter(
+            user=self.reader, recipe__in=ids
+        ).exists())
+        self.assertEqual(get_differences(), {})
+
+    def test_invalid_ids(self):
+        for ids in ([], list(range(1, MAX_BATCH_SIZE + 2))):
+            for method in ('post', 'delete'):
+                with self.subTest(method=method, size=len(ids)):
+                    response = getattr(self.client, method)(
+                        self.url, {'ids': ids}, format='json'
+                    )
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('ids', response.json())
+
+    def test_concurrent_insert(self):
+        concurrent = self.recipes[3]
+        filter_recipes = Recipe.objects.filter
+
+        def insert_concurrently(*args, **kwargs):
+            """
+            Параллельный запрос добавляет рецепт после того,
+            как список пользователя уже прочитан.
+            """
+            if not ShoppingCart.objects.filter(
+                user=self.reader, recipe=concurrent
+            ).exists():
+                ShoppingCart.objects.create(
+                    user=self.reader, recipe=concurrent
+                )
+            return filter_recipes(*args, **kwargs)
+
+        ids = [recipe.id for recipe in self.recipes[2:5]]
+        with mock.patch.object(
+            Recipe.objects, 'filter', side_effect=insert_concurrently
+        ), mock.patch.object(
+            ShoppingCart.objects, 'bulk_create',
+            wraps=ShoppingCart.objects.bulk_create
+        ) as bulk_create:
+            self.assertEqual(
+                self.send('post', ids), ['exists', 'exists', 'added']
+            )
+        # Первая вставка столкнулась с параллельной строкой и повторена.
+        self.assertEqual(bulk_create.call_count, 2)
+        self.assertEqual(get_differences(), {})
+        self.assertEqual(
+            Recipe.objects.get(id=concurrent.id).shopping_carts_count, 1
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageVariantsTest(ImagePoolMixin, APITestCase):
+    """Уменьшенные копии изображения и ссылки на них."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog(recipes_count=1)
+        cls.recipe = cls.recipes[0]
+        cls.author_token = Token.objects.create(user=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._overridden_settings['MEDIA_ROOT'], True)
+        super().tearDownClass()
+
+    def get_variants(self):
+        with mock.patch.object(
+            FileSystemStorage, 'exists', side_effect=AssertionError
+        ):
+            response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        return response.json()['image_variants']
+
+    def test_original_until_rendered(self):
+        variants = self.get_variants()
+        self.assertEqual(
+            set(variants.values()),
+            {f'http://testserver{self.recipe.image.url}'}
+        )
+        mark_image_rendered(self.recipe.image.name)
+        variants = self.get_variants()
+        self.assertTrue(variants['thumbnail'].endswith('_thumbnail.webp'))
+        self.assertTrue(variants['medium'].endswith('_medium.webp'))
+
+    def test_upload_schedules_variants(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.author_token}'
+        )
+        self.schedule_variants.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {'image': PNG_DATA_URI}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.recipe.refresh_from_db()
+        self.schedule_variants.assert_called_once_with(
+            self.recipe.image.name, mark_image_rendered
+        )
+        self.assertEqual(render_variants(
+            *get_render_task(self.recipe.image.name)
+        ), 2)
+        self.assertEqual(render_variants(
+            *get_render_task(self.recipe.image.name)
+        ), 0)
+
+
+class Base64ImageFieldTest(ImagePoolMixin, APITestCase):
+    """Ошибки разбора изображения из data URI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog(recipes_count=1)
+        cls.recipe = cls.recipes[0]
+        cls.token = Token.objects.create(user=cls.author)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.schedule_variants.reset_mock()
+
+    def assertImageError(self, image, code, **kwargs):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/', {'image': image},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400, response.content)
+        message = Base64ImageField.default_error_messages[code]
+        self.assertEqual(
+            response.json(), {'image': [str(message).format(**kwargs)]}
+        )
+        self.schedule_variants.assert_not_called()
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=16)
+    def test_too_large(self):
+        self.assertImageError(PNG_DATA_URI, 'too_large', max_size=16)
+
+    def test_not_image(self):
+        payload = base64.b64encode(b'plain text, not an image').decode()
+        self.assertImageError(
+            f'data:image/png;base64,{payload}', 'unknown_format'
+        )
+
+    def test_invalid_base64(self):
+        self.assertImageError(
+            'data:image/png;base64,iVBORw0K*GgoAAAA', 'invalid_base64'
+        )
+
+    def test_empty(self):
+        self.assertImageError('data:image/png;base64,', 'invalid_base64')
+
+
+class TokenCacheTest(ImagePoolMixin, APITestCase):
+    """Кэш токенов: тёплый запрос без запросов к базе, сброс по событиям."""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email='user@test.ru', username='user', password='password'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def authenticate(self):
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Token {self.token}'
+        )
+        return CachingTokenAuthentication().authenticate(request)
+
+    def get_me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_warm_request_without_queries(self):
+        self.assertEqual(self.get_me().status_code, 200)
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_logout(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_set_password(self):
+        """
+        djoser оставляет токен действительным (LOGOUT_ON_PASSWORD_CHANGE
+        выключен), но снимок пользователя перечитывается из базы.
+        """
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'password', 'new_password': 'Nw8%kq2pL!'
+            })
+        self.assertEqual(response.status_code, 204)
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertTrue(user.check_password('Nw8%kq2pL!'))
+        self.assertEqual(self.get_me().status_code, 200)
+
+    def test_deactivation(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_user_delete(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.get_me().status_code, 401)
+
+
+class AsgiViewsTest(ImagePoolMixin, TransactionTestCase):
+    """
+    Представления под ASGI: чтение в пуле потоков, запись в общем
+    потоке. Данные фиксируются, чтобы их видели соединения пула.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author, self.reader, self.recipes = create_catalog()
+        Subscribe.objects.create(author=self.author, follower=self.reader)
+        self.token = Token.objects.create(user=self.reader)
+
+    def request(self, path, method='GET', query='', accept='*/*'):
+        scope = get_scope(path, query, [
+            (b'authorization', f'Token {self.token}'.encode()),
+            (b'accept', accept.encode()),
+        ])
+        scope['method'] = method
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(application)(scope, receive, send)
+        return messages[0]['status'], b''.join(
+            message.get('body', b'') for message in messages[1:]
+        )
+
+    def test_read_endpoints(self):
+        for path, query in (
+            ('/api/recipes/', 'limit=5'),
+            (f'/api/recipes/{self.recipes[0].id}/', ''),
+            ('/api/tags/', ''),
+            ('/api/ingridients/', 'name=ингр'),
+            ('/api/users/subscriptions/', 'limit=5'),
+        ):
+            with self.subTest(path=path):
+                status, body = self.request(path, query=query)
+                self.assertEqual(status, 200, body)
+
+    def test_download_shopping_cart(self):
+        status, body = self.request(
+            '/api/recipes/download_shopping_cart/', accept='text/plain'
+        )
+        self.assertEqual(status, 200)
+        self.assertIn('Ингридиент 0 (грамм) - 3', body.decode())
+
+    def test_write_endpoint(self):
+        status, body = self.request(
+            f'/api/recipes/{self.recipes[5].id}/favorite/', method='POST'
+        )
+        self.assertEqual(status, 201, body)
+        self.assertTrue(FavoriteList.objects.filter(
+            user=self.reader, recipe=self.recipes[5]
+        ).exists())
+
+
+def get_table_scans(sql):
+    """Обходы таблиц базы в плане EXPLAIN QUERY PLAN запроса."""
+    tables = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    scans = []
+    for detail in details:
+        match = PLAN_SCAN.match(detail)
+        # Виртуальная таблица FTS5 с условием MATCH читается по индексу.
+        if (
+            match and match['table'] in tables
+            and 'VIRTUAL TABLE INDEX' not in detail
+        ):
+            scans.append((match['table'], detail))
+    return scans
+
+
+def is_allowed_scan(table, sql):
+    return any(
+        table == allowed_table and re.search(pattern, sql)
+        for allowed_table, pattern, reason in ALLOWED_SCANS
+    )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class QueryPlanTest(ImagePoolMixin, APITestCase):
+    """
+    Запросы эндпоинтов api не обходят таблицы целиком,
+    кроме перечисленных в ALLOWED_SCANS.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader, cls.recipes = create_catalog()
+        Subscribe.objects.create(author=cls.author, follower=cls.reader)
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.author_token = Token.objects.create(user=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._overridden_settings['MEDIA_ROOT'], True)
+        super().tearDownClass()
+
+    def get_endpoints(self):
+        """Запросы клиентов: метод, адрес, данные и токен."""
+        recipe = self.recipes[5]
+        tag = Tag.objects.first()
+        ingridient = Ingridient.objects.first()
+        recipe_data = {
+            'name': 'Новый рецепт', 'text': 'Текст', 'cooking_time': 5,
+            'tags': [tag.id],
+            'ingridients': [{'id': ingridient.id, 'amount': 10}],
+        }
+        return (
+            ('get', '/api/recipes/', {'limit': 6}),
+            ('get', '/api/recipes/', {'limit': 6, 'page': 2}),
+            ('get', '/api/recipes/', {'limit': 6, 'cursor': ''}),
+            ('get', '/api/recipes/', {'limit': 6, 'author': self.author.id}),
+            ('get', '/api/recipes/', {'limit': 6, 'tags': [tag.slug]}),
+            ('get', '/api/recipes/', {'limit': 6, 'is_favorite': 1}),
+            ('get', '/api/recipes/', {'limit': 6, 'is_in_shopping_cart': 1}),
+            ('get', '/api/recipes/', {'limit': 6, 'search': 'рецепт'}),
+            ('get', f'/api/recipes/{recipe.id}/', {}),
+            ('get', '/api/recipes/feed/', {'limit': 6}),
+            ('get', '/api/recipes/download_shopping_cart/', {}),
+            ('get', '/api/tags/', {}),
+            ('get', f'/api/tags/{tag.id}/', {}),
+            ('get', '/api/ingridients/', {}),
+            ('get', '/api/ingridients/', {'name': 'ингр'}),
+            ('get', f'/api/ingridients/{ingridient.id}/', {}),
+            ('get', '/api/users/', {'limit': 6}),
+            ('get', f'/api/users/{self.author.id}/', {}),
+            ('get', '/api/users/me/', {}),
+            ('get', '/api/users/subscriptions/', {'limit': 6}),
+            ('delete', f'/api/users/{self.author.id}/subscribe/', {}),
+            ('post', f'/api/users/{self.author.id}/subscribe/', {}),
+            ('post', f'/api/recipes/{recipe.id}/favorite/', {}),
+            ('delete', f'/api/recipes/{recipe.id}/favorite/', {}),
+            ('post', f'/api/recipes/{recipe.id}/shopping_cart/', {}),
+            ('delete', f'/api/recipes/{recipe.id}/shopping_cart/', {}),
+            (
+                'post', '/api/recipes/favorite/batch/',
+                {'ids': [self.recipes[6].id, self.recipes[7].id]}
+            ),
+            (
+                'delete', '/api/recipes/shopping_cart/batch/',
+                {'ids': [self.recipes[0].id]}
+            ),
+            (
+                'post', '/api/recipes/',
+                {**recipe_data, 'image': PNG_DATA_URI}, self.author_token
+            ),
+            (
+                'patch', f'/api/recipes/{self.recipes[1].id}/',
+                recipe_data, self.author_token
+            ),
+            (
+                'delete', f'/api/recipes/{self.recipes[2].id}/',
+                {}, self.author_token
+            ),
+        )
+
+    def test_no_table_scans(self):
+        for method, path, data, *token in self.get_endpoints():
+            token = token[0] if token else self.token
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            with self.subTest(method=method, path=path, data=data):
+                with CaptureQueriesContext(connection) as context:
+                    if method == 'get':
+                        response = self.client.get(path, data)
+                    else:
+                        response = getattr(self.client, method)(
+                            path, data, format='json'
+                        )
+                self.assertLess(
+                    response.status_code, 400, getattr(response, 'data', None)
+                )
+                scans = [
+                    (table, detail, query['sql'])
+                    for query in context.captured_queries
+                    if query['sql'].lstrip().upper().startswith(
+                        ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+                    )
+                    for table, detail in get_table_scans(query['sql'])
+                    if not is_allowed_scan(table, query['sql'])
+                ]
+                self.assertFalse(scans, '\n'.join(
+                    f'{detail}: {sql}' for table, detail, sql in scans
+                ))
+
+
+class IndexPageTest(ImagePoolMixin, APITestCase):
+    """Страница эндпоинтов: ETag, 304 без запросов, сброс по адресам."""
+
+    def setUp(self):
+        clear_url_caches()
+        # Предупреждения генератора схемы DRF (одинаковые operationId,
+        # фильтры без схемы) к странице отношения не имеют.
+        catcher = warnings.catch_warnings()
+        catcher.__enter__()
+        self.addCleanup(catcher.__exit__)
+        warnings.simplefilter('ignore')
+
+    def test_not_modified(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/api/recipes/', response.content.decode())
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_rebuilt_after_clear_url_caches(self):
+        with mock.patch(
+            'api_users.schema.get_schema', wraps=schema.get_schema
+        ) as get_schema:
+            etag = self.client.get('/')['ETag']
+            self.assertEqual(self.client.get('/')['ETag'], etag)
+            self.assertEqual(get_schema.call_count, 1)
+            clear_url_caches()
+            self.assertEqual(self.client.get('/')['ETag'], etag)
+            self.assertEqual(get_schema.call_count, 2)
@@ -1,41 +1,79 @@
+from calendar import timegm
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    BooleanField, Count, Exists, F, Max, OuterRef, Subquery, Value
+)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserViewSet
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from recipes.counters import recount_related
+from recipes.feed import pull_feed
+from recipes.shopping_list import add_recipes
+from recipes.sql import delete_rows
 from recipes.models import (
-    FavoriteList, Ingridient, Recipe, ShoppingCart, Subscribe, Tag, User
+    FavoriteList, Ingridient, Recipe, ShoppingCart, ShoppingListItem,
+    Subscribe, Tag, User
+)
+from recipes.validators import (
+    BATCH_ADDED, BATCH_EXISTS, BATCH_INSERT_ATTEMPTS, BATCH_NOT_FOUND,
+    BATCH_REMOVED
 )
-from recipes.validators import DEFAULT_LIST_LIMIT
 from .serializers import (
-    FavoriteListSerializer, IngridientSerializer, ReadRecipeSerializer, 
-    ShoppingCartSerializer, SimpleRecipeSerializer, SubcribeSerializer,
-    TagSerializer, UserRecipesSerializer, WriteRecipeSerializer
+    FavoriteListSerializer, FollowedAuthors, IngridientSerializer,
+    ReadRecipeSerializer, RecipeIdsSerializer, ShoppingCartSerializer,
+    SimpleRecipeSerializer, SubcribeSerializer, TagSerializer,
+    UserRecipesSerializer, WriteRecipeSerializer, get_limit
+)
+from .autocomplete import search_ingridients
+from .cache import (
+    CatalogCacheMixin, make_etag
 )
 from .filters import RecipesFilters
-from .pagination import PageNumberPagination
+from .pagination import PageNumberOrCursorPagination
+from .renderers import (
+    CSVShoppingListRenderer, PDFShoppingListRenderer, TextShoppingListRenderer
+)
 
 
 class UserViewSet(DjoserViewSet):
     """
     Вьюсет пользователей с подписоками и пагинацией.
     """
-    pagination_class = PageNumberPagination
+    pagination_class = PageNumberOrCursorPagination
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
         if self.action == 'subscriptions':
             follower = self.request.user
-            return follower.subscriptions.all()
+            return follower.subscriptions.annotate(
+                is_subscribed=Value(True, output_field=BooleanField())
+            ).order_by('id')
         return super().get_queryset()
-    
+
+    def get_instance(self):
+        """
+        Профиль me читается из базы: request.user - снимок из кэша
+        токенов, а счётчики рецептов и подписчиков меняются UPDATE
+        без сигналов и не сбрасывают его.
+        """
+        return User.objects.get(pk=self.request.user.pk)
+
     def get_serializer_class(self):
         if self.action == 'subscriptions':
             return UserRecipesSerializer
         return super().get_serializer_class()
 
-    @action(['get'], detail=False)
+    @action(['get'], detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -50,6 +88,9 @@ class UserViewSet(DjoserViewSet):
             serializer = SubcribeSerializer(data=data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            # Счётчик подписчиков изменён сигналом запросом UPDATE.
+            author.refresh_from_db(fields=('followers_count',))
+            FollowedAuthors.for_request(request).add(author.id)
             context = {'request': request}
             user_recipes_serializer = UserRecipesSerializer(
                 instance=author, context=context
@@ -65,6 +106,7 @@ class UserViewSet(DjoserViewSet):
                 follower=request.user.id
             )
             subscribe.delete()
+            FollowedAuthors.for_request(request).discard(subscribe.author_id)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -72,12 +114,117 @@ class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для модели Recipe."""
     queryset = Recipe.objects.all()
     http_method_names = ['get', 'post', 'patch', 'delete']
-    pagination_class = PageNumberPagination
+    pagination_class = PageNumberOrCursorPagination
+    cursor_ordering = ('-id',)
     filter_backends = (DjangoFilterBackend,)
-    filter_class = RecipesFilters
+    filterset_class = RecipesFilters
+
+    def get_queryset(self):
+        # Флаги избранного и корзины считаются коррелированными EXISTS,
+        # тэги и ингридиенты подгружаются двумя запросами на страницу.
+        queryset = Recipe.objects.order_by('-id').prefetch_related(
+            *ReadRecipeSerializer.get_prefetch_lookups()
+        )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorite=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_favorite=Exists(FavoriteList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+
+    @staticmethod
+    def get_user_lists_state(user):
+        """
+        Число строк и последний id избранного и корзины пользователя
+        подзапросами: добавление или удаление рецепта меняет хотя бы
+        одно из значений.
+        """
+        state = {}
+        for name, model in (
+            ('favorites', FavoriteList), ('shopping_cart', ShoppingCart)
+        ):
+            rows = model.objects.filter(user=user).order_by().values('user')
+            for key, function in (('count', Count), ('last_id', Max)):
+                state[f'{name}_{key}'] = Max(Subquery(
+                    rows.annotate(value=function('id')).values('value')
+                ))
+        return state
+
+    def get_modification_state(self):
+        """
+        Время последнего изменения и число рецептов ответа
+        одним агрегирующим запросом, без аннотаций и сериализации.
+        Счётчики избранного и корзин тоже сдвигают updated_at.
+        """
+        queryset = Recipe.objects.all()
+        if self.action == 'retrieve':
+            queryset = queryset.filter(pk=self.kwargs['pk'])
+        else:
+            queryset = self.filter_queryset(queryset)
+        user_state = {}
+        if self.request.user.is_authenticated:
+            user_state = self.get_user_lists_state(self.request.user)
+        return queryset.aggregate(
+            last_modified=Max('updated_at'), count=Count('id'), **user_state
+        )
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        """
+        ETag и Last-Modified для чтения рецептов, 304 без сериализации.
+        Ответ авторизованного пользователя зависит ещё и от его избранного
+        и корзины: их состояние входит в ETag, а Last-Modified
+        не отправляется.
+        """
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return handler(request, *args, **kwargs)
+        try:
+            state = self.get_modification_state()
+        except (TypeError, ValueError):
+            return handler(request, *args, **kwargs)
+        if self.action == 'retrieve' and not state['count']:
+            return handler(request, *args, **kwargs)
+        user = request.user
+        parts = [
+            *state.values(), request.get_full_path(),
+            request.accepted_media_type
+        ]
+        last_modified = None
+        if user.is_authenticated:
+            parts.append(user.id)
+        elif state['last_modified'] is not None:
+            last_modified = timegm(state['last_modified'].utctimetuple())
+        etag = make_etag(*parts)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
 
     def get_serializer_class(self):
-        if self.action in ('create', 'update'):
+        if self.action in ('create', 'update', 'partial_update'):
             return WriteRecipeSerializer
         return ReadRecipeSerializer
     
@@ -94,7 +241,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         write_serializer_class = kwargs.get('write_serializer_class', None)
 
         if list_model is None or write_serializer_class is None:
-            Response(status=status.HTTP_418_IM_A_TEAPOT)
+            return Response(status=status.HTTP_418_IM_A_TEAPOT)
 
         if request.method == 'POST':
             instance = get_object_or_404(instance_model, id=kwargs.get('id',0))
@@ -102,17 +249,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'user': request.user.id,
                 'recipe': instance.id
             }
-            recipes_limit = request.query_params.get(
-                'recipes_limit',
-                DEFAULT_LIST_LIMIT
-            )
             write_serializer = write_serializer_class(data=data)
             write_serializer.is_valid(raise_exception=True)
             write_serializer.save()
             read_serializer = read_serializer_class(
-                instance=instance, recipes_limit=recipes_limit
+                instance=instance, context=self.get_serializer_context()
+            )
+            return Response(
+                read_serializer.data, status=status.HTTP_201_CREATED
             )
-            Response(read_serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == 'DELETE':
             unit = get_object_or_404(
                 list_model,
@@ -120,35 +265,197 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 recipe=kwargs.get('id', 0)
             )
             unit.delete()
-            Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(['post', 'delete'], detail=True)
+    @staticmethod
+    def insert_batch(list_model, user, ids):
+        """
+        Вставка рецептов ids в список пользователя.
+        Возвращает рецепты, которые уже были в списке, и добавленные.
+        INSERT идёт без ignore_conflicts: строка, вставленная параллельным
+        запросом, откатывает savepoint, и список перечитывается, поэтому
+        добавленными считаются только строки этой транзакции.
+        """
+        for attempt in range(BATCH_INSERT_ATTEMPTS):
+            listed = set(list_model.objects.filter(
+                user=user, recipe__in=ids
+            ).values_list('recipe', flat=True))
+            found = set(Recipe.objects.filter(
+                pk__in=ids
+            ).values_list('id', flat=True))
+            changed = [id for id in ids if id in found - listed]
+            try:
+                with transaction.atomic():
+                    list_model.objects.bulk_create([
+                        list_model(user=user, recipe_id=id) for id in changed
+                    ])
+            except IntegrityError:
+                if attempt == BATCH_INSERT_ATTEMPTS - 1:
+                    raise
+            else:
+                return listed, changed
+
+    def perform_batch_action(self, request, list_model):
+        """
+        Добавление и удаление списка рецептов одной транзакцией.
+        Число запросов не зависит от длины списка: строки вставляются
+        одним INSERT и удаляются одним DELETE ... IN, поэтому счётчики
+        рецептов и список покупок обновляются здесь, а не сигналами.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        user = request.user
+        with transaction.atomic():
+            if request.method == 'POST':
+                listed, changed = self.insert_batch(list_model, user, ids)
+                results = {id: BATCH_EXISTS for id in listed}
+                results.update((id, BATCH_ADDED) for id in changed)
+            else:
+                listed = set(list_model.objects.select_for_update().filter(
+                    user=user, recipe__in=ids
+                ).values_list('recipe', flat=True))
+                changed = [id for id in ids if id in listed]
+                delete_rows(list_model, user=user, recipe=changed)
+                results = {id: BATCH_REMOVED for id in changed}
+            if changed:
+                recount_related(list_model, changed)
+                if list_model is ShoppingCart:
+                    add_recipes(
+                        user.id, changed, 1 if request.method == 'POST' else -1
+                    )
+        return Response({'results': [
+            {'id': id, 'status': results.get(id, BATCH_NOT_FOUND)}
+            for id in ids
+        ]})
+
+    @action(
+        ['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        cursor_ordering=('-feed_recipe',)
+    )
+    def feed(self, request, *args, **kwargs):
+        # Страница ленты - диапазон индекса (follower, recipe)
+        # таблицы FeedEntry, рецепты соединяются по первичному ключу.
+        pull_feed(request.user)
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            feed_entries__follower=request.user
+        ).annotate(
+            feed_recipe=F('feed_entries__recipe')
+        ).order_by('-feed_recipe')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(
+        ['post', 'delete'],
+        detail=True,
+        permission_classes=(IsAuthenticated,)
+    )
     def shopping_cart(self, request, *args, **kwargs):
-        self.perform_action(
+        return self.perform_action(
             request=request,
+            id=kwargs.get('pk', 0),
             list_model=ShoppingCart,
             write_serializer_class=ShoppingCartSerializer
         )
 
-    @action(['get'], detail=False)
+    @action(
+        ['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request, *args, **kwargs):
+        return self.perform_batch_action(request, ShoppingCart)
+
+    @action(
+        ['get'],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            TextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            PDFShoppingListRenderer
+        )
+    )
     def download_shopping_cart(self, request, *args, **kwargs):
-        ...
-    
-    @action(['post', 'delete'], detail=True)
+        # Суммы ингридиентов корзины хранятся в ShoppingListItem
+        # и обновляются при изменении корзины. Строки (по одной на
+        # ингридиент и единицу) читаются до ответа: под ASGI тело
+        # ответа перебирается в цикле событий, где база недоступна.
+        rows = list(ShoppingListItem.objects.filter(
+            user=request.user
+        ).order_by(
+            'ingridient__name', 'measurement_unit__name'
+        ).values_list(
+            'ingridient__name', 'amount', 'measurement_unit__name'
+        ))
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(rows), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{renderer.get_filename()}"'
+        )
+        return response
+
+    @action(
+        ['post', 'delete'],
+        detail=True,
+        permission_classes=(IsAuthenticated,)
+    )
     def favorite(self, request, *args, **kwargs):
-        self.perform_action(
+        return self.perform_action(
             request=request,
+            id=kwargs.get('pk', 0),
             list_model=FavoriteList,
             write_serializer_class = FavoriteListSerializer
         )
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(
+        ['post', 'delete'],
+        detail=False,
+        url_path='favorite/batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_batch(self, request, *args, **kwargs):
+        return self.perform_batch_action(request, FavoriteList)
+
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для модели Tag."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    catalog_models = (Tag,)
 
 
-class IngridientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Вьюсет для модели Ingridient."""
+class IngridientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Вьюсет для модели Ingridient.
+    С параметром ?name= - автодополнение: не более limit ингридиентов,
+    сначала начинающиеся с name, затем содержащие name.
+    """
     queryset = Ingridient.objects.all()
     serializer_class = IngridientSerializer
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    catalog_models = (Ingridient,)
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(self.search, request)
+
+    def search(self, request):
+        return Response(search_ingridients(
+            request.query_params['name'], get_limit(request, 'limit')
+        ))
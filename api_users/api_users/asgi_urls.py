@@ -0,0 +1,4 @@
+from api.async_views import get_async_urlpatterns
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = get_async_urlpatterns(sync_urlpatterns)
@@ -1,8 +1,18 @@
-from django.shortcuts import render
+import hashlib
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import get_resolver
+from django.views.decorators.http import etag
 from rest_framework.schemas.openapi import SchemaGenerator
 
+_lock = threading.Lock()
+_page = None
 
-def schema(request):
+
+def get_schema():
     """Схема api запросов."""
     generator = SchemaGenerator(title='Yandex Praktikum')
     getted_schema = generator.get_schema() or {
@@ -15,5 +25,34 @@ def schema(request):
     for path in getted_schema['paths']:
         for method in getted_schema['paths'][path].keys():
             schema['endpoints'].append({'path': path, 'method': method})
+    return schema
+
 
-    return render(request, 'index.html', {'schema': schema})
+def get_index_page():
+    """
+    Страница со списком эндпоинтов и её ETag.
+    Строится один раз для текущей конфигурации адресов: после
+    clear_url_caches() get_resolver() возвращает новый объект.
+    """
+    global _page
+    resolver = get_resolver(settings.ROOT_URLCONF)
+    page = _page
+    if page is not None and page[0] is resolver:
+        return page
+    with _lock:
+        if _page is None or _page[0] is not resolver:
+            content = render_to_string(
+                'index.html', {'schema': get_schema()}
+            ).encode()
+            _page = (
+                resolver,
+                content,
+                '"%s"' % hashlib.md5(content).hexdigest()
+            )
+        return _page
+
+
+@etag(lambda request: get_index_page()[2])
+def schema(request):
+    """Список эндпоинтов api."""
+    return HttpResponse(get_index_page()[1])
@@ -34,11 +34,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +66,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'api_users.wsgi.application'
 
+# Маршруты для ASGI: те же адреса с асинхронными представлениями.
+ASGI_URLCONF = 'api_users.asgi_urls'
+
+# Число потоков, в которых под ASGI выполняются запросы на чтение
+# рецептов, тэгов, ингридиентов и подписок.
+ASYNC_VIEW_WORKERS = 32
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -76,6 +85,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/ref/settings/#caches
+
+# Версии и ответы справочников хранятся в кэше default. Локальный кэш
+# у каждого процесса свой: изменения справочников из других воркеров
+# видны не позже, чем через CATALOG_CACHE_TIMEOUT. Общий кэш
+# (django.core.cache.backends.memcached.PyMemcacheCache, Redis)
+# делает их видимыми сразу.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -96,19 +120,73 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachingTokenAuthentication',
     ),
 }
 
 AUTH_USER_MODEL = 'recipes.User'
 
+# Максимальный размер изображения рецепта после декодирования base64.
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+# Число процессов для создания уменьшенных копий изображений рецептов.
+RECIPE_IMAGE_WORKERS = 2
+
+# Автодополнение ингридиентов из каталога в памяти процесса.
+INGRIDIENT_INDEX_CACHE = True
+
+# Время жизни в секундах версий и ответов справочников в кэше.
+# С локальным кэшем в каждом процессе изменения из других процессов
+# видны не позже, чем через это время; с общим кэшем (Redis, Memcached)
+# его можно увеличить.
+CATALOG_CACHE_TIMEOUT = 60
+
+# Число подписчиков, после которого рецепты автора не рассылаются
+# по лентам, а подтягиваются подписчиками при чтении ленты.
+FEED_FANOUT_LIMIT = 10000
+
+# Кэш токенов в памяти процесса: число записей и их время жизни
+# в секундах. Выход в другом процессе виден не позже, чем через это время.
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 60
+
+# Число SQL-запросов, после которого запрос пишется в журнал
+# api.middleware с уровнем WARNING.
+QUERY_COUNT_THRESHOLD = 20
+
+# Профилирование запросов: доля случайных запросов (0 - выключено)
+# и запуск по заголовку X-Profile или параметру ?profile для сотрудников.
+# Профили хранятся в PROFILE_DIR, старые удаляются после PROFILE_MAX_FILES.
+# Под ASGI включённое профилирование выполняет запросы по одному.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_ON_DEMAND = False
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_MAX_FILES = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'PERMISSIONS': {
         'user': ['djoser.permissions.CurrentUserOrAdminOrReadOnly']
     },
     'SERIALIZERS': {
-        'user': 'api.serializers.UserSerializer'
+        'user': 'api.serializers.UserSerializer',
+        'current_user': 'api.serializers.UserSerializer'
     }
 }
 
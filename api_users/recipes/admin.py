@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from .models import (
-    Tag, Ingridient, Recipe, Subscribe, FavoriteList, ShoppingCart, User, MeasurementUnit, RecipeIngridient
+    Tag, Ingridient, Recipe, Subscribe, FavoriteList, ShoppingCart, User, MeasurementUnit, RecipeIngridient,
+    UnitConversion
 )
 
 
@@ -39,3 +40,4 @@ class RecipeAdmin(admin.ModelAdmin):
 admin.site.register(Tag)
 admin.site.register(Ingridient)
 admin.site.register(MeasurementUnit)
+admin.site.register(UnitConversion)
@@ -5,4 +5,7 @@ from django.utils.translation import gettext_lazy as _
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
-    verbose_name = _('recipes')
\ No newline at end of file
+    verbose_name = _('recipes')
+
+    def ready(self):
+        from . import signals  # noqa: F401
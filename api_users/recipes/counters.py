@@ -0,0 +1,58 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import FavoriteList, Recipe, ShoppingCart, Subscribe, User
+
+# Строки модели source увеличивают счётчик counter объекта field.
+COUNTERS = (
+    (FavoriteList, 'recipe', Recipe, 'favorites_count'),
+    (ShoppingCart, 'recipe', Recipe, 'shopping_carts_count'),
+    (Subscribe, 'author', User, 'followers_count'),
+    (Recipe, 'author', User, 'recipes_count'),
+)
+
+
+def get_changes(model, counter, value):
+    """
+    Поля UPDATE счётчика. Рецепты выводятся вместе со счётчиками,
+    поэтому их изменение сдвигает и updated_at (ETag, Last-Modified).
+    """
+    changes = {counter: value}
+    if model is Recipe:
+        changes['updated_at'] = timezone.now()
+    return changes
+
+
+def change_counters(instance, delta):
+    """Изменяет счётчики, зависящие от строки instance, на delta."""
+    for source, field, model, counter in COUNTERS:
+        if isinstance(instance, source):
+            model.objects.filter(
+                pk=getattr(instance, f'{field}_id')
+            ).update(**get_changes(model, counter, F(counter) + delta))
+
+
+def recount(source, field, model, counter, queryset=None):
+    """
+    Пересчитывает счётчик одним UPDATE с подзапросом COUNT.
+    Меняются только расходящиеся строки, возвращается их число.
+    """
+    if queryset is None:
+        queryset = model.objects.all()
+    counts = source.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    count = Coalesce(Subquery(counts), 0)
+    return queryset.exclude(**{counter: count}).update(
+        **get_changes(model, counter, count)
+    )
+
+
+def recount_related(source, pks):
+    """Пересчитывает счётчики объектов pks, зависящие от строк source."""
+    for counter_source, field, model, counter in COUNTERS:
+        if counter_source is source:
+            recount(
+                source, field, model, counter, model.objects.filter(pk__in=pks)
+            )
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db.models import Max
+
+from .models import FeedEntry, Recipe, Subscribe, User
+from .validators import FEED_BACKFILL_LIMIT
+
+
+def add_entries(follower_ids, author_id, recipe_ids):
+    FeedEntry.objects.bulk_create([
+        FeedEntry(follower_id=follower_id, author_id=author_id, recipe_id=id)
+        for follower_id in follower_ids
+        for id in recipe_ids
+    ], ignore_conflicts=True)
+
+
+def get_latest_recipes(author_id, after=0):
+    return list(Recipe.objects.filter(
+        author_id=author_id, pk__gt=after
+    ).order_by('-id').values_list('id', flat=True)[:FEED_BACKFILL_LIMIT])
+
+
+def fan_out_recipes(author, recipe_ids):
+    """
+    Рассылает новые рецепты автора в ленты его подписчиков.
+    Автор, у которого больше FEED_FANOUT_LIMIT подписчиков,
+    переводится в режим чтения: его рецепты подтягивает pull_feed.
+    """
+    if author.feed_pull:
+        return
+    follower_ids = list(Subscribe.objects.filter(
+        author=author
+    ).values_list('follower', flat=True)[:settings.FEED_FANOUT_LIMIT + 1])
+    if len(follower_ids) > settings.FEED_FANOUT_LIMIT:
+        User.objects.filter(pk=author.pk).update(feed_pull=True)
+        return
+    add_entries(follower_ids, author.pk, recipe_ids)
+
+
+def fan_out(recipe):
+    """Рассылает новый рецепт в ленты подписчиков автора."""
+    fan_out_recipes(recipe.author, [recipe.pk])
+
+
+def backfill(subscribe):
+    """Добавляет в ленту последние рецепты автора при подписке."""
+    if subscribe.author.feed_pull:
+        return
+    add_entries(
+        [subscribe.follower_id],
+        subscribe.author_id,
+        get_latest_recipes(subscribe.author_id)
+    )
+
+
+def prune(subscribe):
+    """Убирает рецепты автора из ленты при отписке."""
+    FeedEntry.objects.filter(
+        follower_id=subscribe.follower_id, author_id=subscribe.author_id
+    ).delete()
+
+
+def pull_feed(follower):
+    """
+    Дополняет ленту рецептами авторов в режиме чтения,
+    вышедшими после последней записи этого автора в ленте.
+    """
+    author_ids = Subscribe.objects.filter(
+        follower=follower, author__feed_pull=True
+    ).values_list('author', flat=True)
+    for author_id in author_ids:
+        last = FeedEntry.objects.filter(
+            follower=follower, author_id=author_id
+        ).aggregate(last=Max('recipe'))['last']
+        recipe_ids = get_latest_recipes(author_id, after=last or 0)
+        if recipe_ids:
+            add_entries([follower.pk], author_id, recipe_ids)
@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .validators import (
+    IMAGE_VARIANTS, IMAGE_VARIANTS_DIR, IMAGE_VARIANT_EXTENSION,
+    IMAGE_VARIANT_FORMAT, IMAGE_VARIANT_QUALITY
+)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_variant_name(name, variant):
+    """Имя файла уменьшенной копии изображения в хранилище."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory,
+        IMAGE_VARIANTS_DIR,
+        f'{stem}_{variant}.{IMAGE_VARIANT_EXTENSION}'
+    )
+
+
+def is_up_to_date(source_path, variant_path):
+    return (
+        os.path.exists(variant_path)
+        and os.path.getmtime(variant_path) >= os.path.getmtime(source_path)
+    )
+
+
+def render_variants(source_path, targets, force=False):
+    """
+    Создаёт уменьшенные копии изображения.
+    targets - список пар (путь к файлу, (ширина, высота)).
+    Выполняется в процессе пула, поэтому работает только с путями
+    файлов и не обращается к базе данных.
+    Возвращает число записанных файлов.
+    """
+    pending = [
+        (path, size) for path, size in targets
+        if force or not is_up_to_date(source_path, path)
+    ]
+    if not pending:
+        return 0
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        mode = 'RGBA' if 'A' in image.getbands() else 'RGB'
+        image = image.convert(mode)
+        for path, size in pending:
+            variant = image.copy()
+            variant.thumbnail(size, Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary_path = f'{path}.tmp'
+            variant.save(
+                temporary_path,
+                IMAGE_VARIANT_FORMAT,
+                quality=IMAGE_VARIANT_QUALITY,
+                method=6
+            )
+            os.replace(temporary_path, path)
+    return len(pending)
+
+
+def get_render_task(name, storage=default_storage):
+    """Аргументы render_variants для изображения из хранилища."""
+    return (
+        storage.path(name),
+        [
+            (storage.path(get_variant_name(name, variant)), size)
+            for variant, size in IMAGE_VARIANTS.items()
+        ]
+    )
+
+
+def get_executor():
+    """
+    Пул процессов для кодирования изображений.
+    Создаётся из потока запроса, поэтому процессы запускаются через
+    spawn: fork копировал бы блокировки и соединения других потоков.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def finish_render(name, on_rendered, future):
+    error = future.exception()
+    if error is not None:
+        logger.error('Image variants were not rendered: %s', error)
+    elif on_rendered is not None:
+        on_rendered(name)
+
+
+def schedule_variants(name, on_rendered=None):
+    """
+    Отправляет изображение в пул процессов, не дожидаясь результата.
+    on_rendered(name) вызывается в служебном потоке пула,
+    когда копии созданы.
+    """
+    if not name:
+        return
+    future = get_executor().submit(render_variants, *get_render_task(name))
+    future.add_done_callback(partial(finish_render, name, on_rendered))
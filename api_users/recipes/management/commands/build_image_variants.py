@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.images import get_render_task, render_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии изображений существующих рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.RECIPE_IMAGE_WORKERS,
+            help='Число процессов для кодирования изображений.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии, даже если они актуальны.'
+        )
+
+    def handle(self, *args, **options):
+        names = list(Recipe.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct())
+        rendered = failed = 0
+        ready = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [
+                executor.submit(
+                    render_variants, *get_render_task(name), options['force']
+                )
+                for name in names
+            ]
+            for name, future in zip(names, futures):
+                try:
+                    rendered += future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(str(error))
+                else:
+                    ready.append(name)
+        Recipe.objects.filter(image__in=ready).exclude(
+            rendered_image=F('image')
+        ).update(rendered_image=F('image'), updated_at=timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} image variants, {failed} images failed.'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.shopping_list import get_differences, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Сверяет списки покупок с корзинами, с --fix пересчитывает их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересчитать списки покупок заново.'
+        )
+
+    def handle(self, *args, **options):
+        differences = get_differences()
+        for (user, ingridient, unit), (actual, expected) in sorted(
+            differences.items()
+        ):
+            self.stdout.write(
+                f'user={user} ingridient={ingridient} unit={unit}: '
+                f'{actual} != {expected}'
+            )
+        if not differences:
+            self.stdout.write(
+                self.style.SUCCESS('Shopping lists are up to date.')
+            )
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'{len(differences)} shopping list rows differ.'
+            )
+        with transaction.atomic():
+            rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(differences)} shopping list rows fixed.'
+        ))
@@ -0,0 +1,453 @@
+import base64
+import json
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.counters import recount
+from recipes.feed import fan_out_recipes
+from recipes.search import index_recipes
+from recipes.shopping_list import refresh_recipes
+from recipes.sql import delete_rows
+from recipes.units import add_conversions
+from recipes.models import (
+    Ingridient, MeasurementUnit, Recipe, RecipeIngridient, Tag, User
+)
+from recipes.validators import (
+    BASE64_MARKER, DEFAULT_COOKING_TIME, DEFAULT_TAG_COLOR,
+    IMPORT_BATCH_SIZE, IMPORT_READ_SIZE, LENGTH_NAME_150, PIECE_UNIT,
+    TO_TASTE_UNIT, normalize_name
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+INGRIDIENT_LINE = re.compile(r'^(?P<name>.+?)\s+(?P<amount>\d+)\s+(?P<unit>.+)$')
+TAG_ITEM = re.compile(r'(?P<name>[^,(]+?)\s*\((?P<slug>[-\w]+)\)')
+TXT_SECTIONS = {
+    'Ингридиенты:': 'ingridients',
+    'Способ приготовления:': 'text',
+    'Тэги:': 'tags',
+    'Автор:': 'author',
+}
+
+
+def insert_rows(model, fields, rows):
+    """
+    Пакетная вставка кортежей значений через executemany.
+    Объекты моделей не создаются: для миллионов строк это основная
+    часть времени bulk_create.
+    """
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(field).column) for field in fields
+    )
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote_name(model._meta.db_table)} '
+            f'({columns}) VALUES ({placeholders})',
+            list(rows)
+        )
+
+
+def iter_json_array(path, read_size=IMPORT_READ_SIZE):
+    """Объекты JSON-массива из файла по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8-sig') as file:
+        buffer = file.read(read_size).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'{path}: a JSON array is expected.')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(read_size)
+                if not chunk:
+                    raise CommandError(f'{path}: unexpected end of file.')
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def parse_txt(path):
+    """Рецепт из текстового файла формата data/recipe*.txt."""
+    sections = {'name': [], 'ingridients': [], 'text': [], 'tags': [],
+                'author': []}
+    current = 'name'
+    with open(path, encoding='utf-8-sig') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            current = TXT_SECTIONS.get(line, current)
+            if line not in TXT_SECTIONS:
+                sections[current].append(line)
+    ingridients = []
+    for line in sections['ingridients']:
+        line = line.rstrip(';.')
+        match = INGRIDIENT_LINE.match(line)
+        if match:
+            ingridients.append({
+                'name': match['name'],
+                'amount': int(match['amount']),
+                'measurement_unit': match['unit']
+            })
+        elif line.endswith(TO_TASTE_UNIT):
+            ingridients.append({
+                'name': line[:-len(TO_TASTE_UNIT)].strip(),
+                'amount': 0,
+                'measurement_unit': TO_TASTE_UNIT
+            })
+        else:
+            ingridients.append({
+                'name': line, 'amount': 1, 'measurement_unit': PIECE_UNIT
+            })
+    tags = [
+        {'slug': match['slug'], 'name': match['name'].strip()}
+        for match in TAG_ITEM.finditer(' '.join(sections['tags']))
+    ]
+    return {
+        'name': ' '.join(sections['name']),
+        'text': '\n'.join(sections['text']),
+        'ingridients': ingridients,
+        'tags': tags,
+        'author': ''.join(sections['author']).rstrip('.'),
+        'image': path.stem,
+    }
+
+
+def find_image(base_dir, image):
+    """Файл изображения: images/<имя>.jpg или images/Base64/<имя>.txt."""
+    if not image:
+        return None
+    stem = Path(image).stem
+    images_dir = base_dir / 'images'
+    candidates = [images_dir / f'{stem}{ext}' for ext in IMAGE_EXTENSIONS]
+    candidates.append(images_dir / 'Base64' / f'{stem}.txt')
+    for candidate in candidates:
+        if candidate.exists():
+            return str(candidate)
+    return None
+
+
+def load_image(path):
+    """
+    Читает и при необходимости декодирует изображение.
+    Выполняется в процессе пула, возвращает (расширение, байты).
+    """
+    if path is None:
+        return None
+    path = Path(path)
+    if path.suffix != '.txt':
+        return path.suffix.lstrip('.'), path.read_bytes()
+    data = path.read_text(encoding='utf-8-sig').strip()
+    header, _, body = data.partition(BASE64_MARKER)
+    return header.rsplit('/', 1)[-1], base64.b64decode(body)
+
+
+def normalize(record, base_dir, default_author):
+    author = record.get('author') or default_author
+    if not author:
+        raise CommandError(
+            f'Recipe "{record["name"]}" has no author, use --author.'
+        )
+    tags = [
+        tag if isinstance(tag, dict) else {'slug': tag, 'name': tag}
+        for tag in record.get('tags', [])
+    ]
+    return {
+        'name': record['name'].strip(),
+        'text': record.get('text', ''),
+        'cooking_time': record.get('cooking_time', DEFAULT_COOKING_TIME),
+        'author': author.strip().lower(),
+        'tags': tags,
+        'ingridients': record.get('ingridients', []),
+        'image': find_image(base_dir, record.get('image')),
+    }
+
+
+def iter_records(paths, default_author):
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from iter_records(sorted(
+                child for child in path.iterdir()
+                if child.suffix in ('.json', '.txt')
+            ), default_author)
+        elif path.suffix == '.json':
+            for record in iter_json_array(path):
+                yield normalize(record, path.parent, default_author)
+        elif path.suffix == '.txt':
+            yield normalize(parse_txt(path), path.parent, default_author)
+        else:
+            raise CommandError(f'{path}: only .json and .txt are supported.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из data/recipes.json и data/recipe*.txt. '
+        'Повторный запуск обновляет уже загруженные рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+', help='Файлы .json/.txt или каталоги с ними.'
+        )
+        parser.add_argument(
+            '--author',
+            help='Email автора для рецептов, где автор не указан.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Число рецептов в одной транзакции.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.RECIPE_IMAGE_WORKERS,
+            help='Число процессов для декодирования изображений.'
+        )
+
+    def handle(self, *args, **options):
+        self.ingridients = self.get_lookup(Ingridient, 'name')
+        self.units = self.get_lookup(MeasurementUnit, 'name')
+        self.tags = self.get_lookup(Tag, 'slug')
+        self.users = self.get_lookup(User, 'email')
+        records = iter_records(options['paths'], options['author'])
+        started = time.monotonic()
+        recipes_count = rows_count = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                rows_count += self.import_batch(batch, executor)
+                recipes_count += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{recipes_count} recipes, {rows_count} rows, '
+                    f'{rows_count / elapsed:.0f} rows/s'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {recipes_count} recipes in '
+            f'{time.monotonic() - started:.1f} s. Run build_image_variants '
+            'to create image thumbnails.'
+        ))
+
+    @staticmethod
+    def get_lookup(model, field):
+        """Словарь значение поля -> id для всей таблицы."""
+        lookup = {}
+        for value, id in model.objects.values_list(field, 'id').iterator():
+            lookup.setdefault(value, id)
+        return lookup
+
+    @staticmethod
+    def create_missing(model, field, lookup, values, **defaults):
+        """
+        Создаёт недостающие строки справочника и дополняет словарь.
+        Вызываемые значения defaults получают значение поля field.
+        """
+        missing = {value for value in values if value not in lookup}
+        if not missing:
+            return 0
+        model.objects.bulk_create([
+            model(**{field: value}, **{
+                key: default(value) if callable(default) else default
+                for key, default in defaults.items()
+            })
+            for value in missing
+        ], ignore_conflicts=True)
+        for value, id in model.objects.filter(
+            **{f'{field}__in': missing}
+        ).values_list(field, 'id'):
+            lookup.setdefault(value, id)
+        return len(missing)
+
+    def create_users(self, emails):
+        missing = {email for email in emails if email not in self.users}
+        User.objects.bulk_create([
+            User(
+                email=email,
+                username=email[:LENGTH_NAME_150],
+                password=make_password(None)
+            )
+            for email in missing
+        ], ignore_conflicts=True)
+        for email, id in User.objects.filter(
+            email__in=missing
+        ).values_list('email', 'id'):
+            self.users[email] = id
+        return len(missing)
+
+    def import_batch(self, batch, executor):
+        rows = 0
+        with transaction.atomic():
+            rows += self.create_missing(
+                Ingridient, 'name', self.ingridients,
+                (item['name'] for record in batch
+                 for item in record['ingridients']),
+                search_name=normalize_name
+            )
+            unit_names = {
+                item['measurement_unit']
+                for record in batch for item in record['ingridients']
+            }
+            units = self.create_missing(
+                MeasurementUnit, 'name', self.units, unit_names
+            )
+            if units:
+                # Новые единицы созданы без сигналов, переводы в базовые
+                # единицы добавляются до пересчёта списков покупок.
+                add_conversions(MeasurementUnit.objects.filter(
+                    name__in=unit_names, conversion__isnull=True
+                ))
+            rows += units
+            tag_names = {
+                tag['slug']: tag['name']
+                for record in batch for tag in record['tags']
+            }
+            missing_tags = [
+                Tag(slug=slug, name=name, color=DEFAULT_TAG_COLOR)
+                for slug, name in tag_names.items() if slug not in self.tags
+            ]
+            if missing_tags:
+                Tag.objects.bulk_create(missing_tags, ignore_conflicts=True)
+                self.tags.update(Tag.objects.filter(
+                    slug__in=[tag.slug for tag in missing_tags]
+                ).values_list('slug', 'id'))
+                rows += len(missing_tags)
+            rows += self.create_users(record['author'] for record in batch)
+
+            recipes, created = self.upsert_recipes(batch, executor)
+            rows += len(recipes)
+            rows += self.replace_relations(batch, recipes)
+            index_recipes(recipes.values())
+            refresh_recipes(recipes.values())
+            # bulk_create не отправляет сигналы, счётчик рецептов
+            # авторов пакета пересчитывается запросом.
+            recount(
+                Recipe, 'author', User, 'recipes_count',
+                User.objects.filter(pk__in={
+                    self.users[record['author']] for record in batch
+                })
+            )
+            self.fan_out(created)
+        return rows
+
+    @staticmethod
+    def fan_out(created):
+        """Новые рецепты пакета - в ленты подписчиков авторов."""
+        recipe_ids = defaultdict(list)
+        for (author_id, _), id in created.items():
+            recipe_ids[author_id].append(id)
+        for author in User.objects.filter(pk__in=recipe_ids):
+            fan_out_recipes(author, recipe_ids[author.pk])
+
+    def get_recipe_ids(self, batch):
+        keys = {(self.users[record['author']], record['name'])
+                for record in batch}
+        return {
+            (author_id, name): id
+            for id, author_id, name in Recipe.objects.filter(
+                author_id__in={author_id for author_id, _ in keys},
+                name__in={name for _, name in keys}
+            ).values_list('id', 'author_id', 'name')
+            if (author_id, name) in keys
+        }
+
+    def upsert_recipes(self, batch, executor):
+        """
+        Создаёт новые и обновляет существующие рецепты пакета.
+        Возвращает id всех рецептов пакета и только созданных.
+        """
+        existing = self.get_recipe_ids(batch)
+        now = timezone.now()
+        new_records = {}
+        changed = []
+        for record in batch:
+            key = (self.users[record['author']], record['name'])
+            if key in existing:
+                changed.append(Recipe(
+                    id=existing[key],
+                    text=record['text'],
+                    cooking_time=record['cooking_time'],
+                    updated_at=now
+                ))
+            else:
+                new_records[key] = record
+        if changed:
+            Recipe.objects.bulk_update(
+                changed, ['text', 'cooking_time', 'updated_at']
+            )
+        records = list(new_records.values())
+        images = executor.map(
+            load_image, [record['image'] for record in records]
+        )
+        new_recipes = []
+        for (author_id, name), record, image in zip(
+            new_records, records, images
+        ):
+            recipe = Recipe(
+                author_id=author_id,
+                name=name,
+                text=record['text'],
+                cooking_time=record['cooking_time']
+            )
+            if image is not None:
+                ext, content = image
+                recipe.image.name = default_storage.save(
+                    Recipe.image.field.generate_filename(
+                        recipe, f'image.{ext}'
+                    ),
+                    ContentFile(content)
+                )
+            new_recipes.append(recipe)
+        Recipe.objects.bulk_create(new_recipes)
+        recipes = self.get_recipe_ids(batch)
+        return recipes, {key: recipes[key] for key in new_records}
+
+    def replace_relations(self, batch, recipes):
+        """Заменяет тэги и ингридиенты рецептов пакета."""
+        recipe_ids = list(recipes.values())
+        Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids).delete()
+        # Без сигналов: поиск и списки покупок пакета пересчитываются
+        # после вставки, по одному разу на пакет.
+        delete_rows(RecipeIngridient, recipe=recipe_ids)
+        tag_links = {}
+        recipe_ingridients = {}
+        for record in batch:
+            recipe_id = recipes[(self.users[record['author']], record['name'])]
+            for tag in record['tags']:
+                tag_id = self.tags[tag['slug']]
+                tag_links[(recipe_id, tag_id)] = (recipe_id, tag_id)
+            for item in record['ingridients']:
+                ingridient_id = self.ingridients[item['name']]
+                recipe_ingridients[(recipe_id, ingridient_id)] = (
+                    recipe_id,
+                    ingridient_id,
+                    item['amount'],
+                    self.units[item['measurement_unit']]
+                )
+        insert_rows(
+            Recipe.tags.through, ('recipe', 'tag'), tag_links.values()
+        )
+        insert_rows(
+            RecipeIngridient,
+            ('recipe', 'ingridient', 'amount', 'measurement_unit'),
+            recipe_ingridients.values()
+        )
+        return len(tag_links) + len(recipe_ingridients)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс рецептов.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{rows} recipes indexed.'))
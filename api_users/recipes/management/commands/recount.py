@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, корзин, подписчиков и рецептов.'
+
+    def handle(self, *args, **options):
+        for source, field, model, counter in COUNTERS:
+            with transaction.atomic():
+                rows = recount(source, field, model, counter)
+            self.stdout.write(
+                f'{model._meta.label}.{counter}: {rows} rows changed.'
+            )
+        self.stdout.write(self.style.SUCCESS('Counters are up to date.'))
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+from recipes.validators import normalize_name
+
+
+def fill_search_name(apps, schema_editor):
+    Ingridient = apps.get_model('recipes', 'Ingridient')
+    ingridients = list(Ingridient.objects.only('id', 'name'))
+    for ingridient in ingridients:
+        ingridient.search_name = normalize_name(ingridient.name)
+    Ingridient.objects.bulk_update(
+        ingridients, ['search_name'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_auto_20261018_0713'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingridient',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200, verbose_name='search name'),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('favoritelist', 'recipe', 'recipe', 'favorites_count'),
+    ('shoppingcart', 'recipe', 'recipe', 'shopping_carts_count'),
+    ('subscribe', 'author', 'user', 'followers_count'),
+    ('recipe', 'author', 'user', 'recipes_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source, field, model, counter in COUNTERS:
+        counts = apps.get_model('recipes', source).objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+        apps.get_model('recipes', model).objects.update(
+            **{counter: Coalesce(Subquery(counts), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='favorites count'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='shopping carts count'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='followers count'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='recipes count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:05
+
+from django.db import migrations
+
+# Заполнение индекса на момент миграции. Копия намеренно заморожена:
+# recipes.search.get_document_sql может меняться, изменение документа
+# поиска оформляется новой миграцией со своей копией запроса.
+INSERT_DOCUMENTS = '''
+    INSERT INTO recipes_recipe_search (rowid, name, text, ingridients)
+    SELECT recipe.id,
+           REPLACE(REPLACE(recipe.name, 'ё', 'е'), 'Ё', 'Е'),
+           REPLACE(REPLACE(recipe.text, 'ё', 'е'), 'Ё', 'Е'),
+           COALESCE((
+               SELECT GROUP_CONCAT(ingridient.search_name, ' ')
+               FROM recipes_recipeingridient AS item
+               JOIN recipes_ingridient AS ingridient
+                 ON ingridient.id = item.ingridient_id
+               WHERE item.recipe_id = recipe.id
+           ), '')
+    FROM recipes_recipe AS recipe
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            '''
+            CREATE VIRTUAL TABLE recipes_recipe_search USING fts5(
+                name, text, ingridients,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            ''',
+            'DROP TABLE recipes_recipe_search'
+        ),
+        migrations.RunSQL(INSERT_DOCUMENTS, migrations.RunSQL.noop),
+    ]
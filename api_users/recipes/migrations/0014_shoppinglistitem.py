@@ -0,0 +1,58 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngridient = apps.get_model('recipes', 'recipeingridient')
+    ShoppingListItem = apps.get_model('recipes', 'shoppinglistitem')
+    rows = RecipeIngridient.objects.filter(
+        recipe__shoppingcart__isnull=False
+    ).values(
+        'recipe__shoppingcart__user', 'ingridient', 'measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount'), total_recipes=Count('id')
+    ).order_by()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=row['recipe__shoppingcart__user'],
+            ingridient_id=row['ingridient'],
+            measurement_unit_id=row['measurement_unit'],
+            amount=row['total_amount'],
+            recipes_count=row['total_recipes']
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='amount')),
+                ('recipes_count', models.IntegerField(default=0, verbose_name='recipes count')),
+                ('ingridient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingridient', verbose_name='ingridient')),
+                ('measurement_unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.measurementunit', verbose_name='measurement unit')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'shopping list item',
+                'verbose_name_plural': 'Shopping list',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingridient', 'measurement_unit'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
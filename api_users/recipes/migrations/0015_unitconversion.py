@@ -0,0 +1,125 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:40
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+# Перевод единиц на момент миграции: название (normalize_name) ->
+# (размерность, базовая единица, множитель). Копия намеренно заморожена:
+# recipes.validators.UNIT_CONVERSIONS может меняться, новые переводы
+# добавляются новой миграцией со своей копией таблицы.
+UNIT_CONVERSIONS = {
+    'г': ('mass', 'грамм', 1),
+    'гр': ('mass', 'грамм', 1),
+    'грамм': ('mass', 'грамм', 1),
+    'кг': ('mass', 'грамм', 1000),
+    'килограмм': ('mass', 'грамм', 1000),
+    'мл': ('volume', 'миллилитр', 1),
+    'миллилитр': ('volume', 'миллилитр', 1),
+    'л': ('volume', 'миллилитр', 1000),
+    'литр': ('volume', 'миллилитр', 1000),
+    'стакан': ('volume', 'миллилитр', 250),
+    'ст. л.': ('volume', 'миллилитр', 15),
+    'столовая ложка': ('volume', 'миллилитр', 15),
+    'ч. л.': ('volume', 'миллилитр', 5),
+    'чайная ложка': ('volume', 'миллилитр', 5),
+    'шт': ('count', 'штука', 1),
+    'шт.': ('count', 'штука', 1),
+    'штука': ('count', 'штука', 1),
+    'десяток': ('count', 'штука', 10),
+}
+
+
+def normalize_name(value):
+    """Копия recipes.validators.normalize_name на момент миграции."""
+    return ' '.join(str(value).casefold().replace('ё', 'е').split())
+
+
+def fill_conversions(apps, schema_editor):
+    MeasurementUnit = apps.get_model('recipes', 'measurementunit')
+    UnitConversion = apps.get_model('recipes', 'unitconversion')
+    base_units = {}
+    for unit in MeasurementUnit.objects.order_by('id'):
+        base_units.setdefault(normalize_name(unit.name), unit)
+    conversions = []
+    for unit in MeasurementUnit.objects.order_by('id'):
+        rule = UNIT_CONVERSIONS.get(normalize_name(unit.name))
+        if rule is None:
+            continue
+        dimension, base_name, factor = rule
+        if base_name not in base_units:
+            base_units[base_name] = MeasurementUnit.objects.create(
+                name=base_name
+            )
+            conversions.append(UnitConversion(
+                measurement_unit=base_units[base_name],
+                base_unit=base_units[base_name],
+                dimension=dimension, factor=1
+            ))
+        conversions.append(UnitConversion(
+            measurement_unit=unit, base_unit=base_units[base_name],
+            dimension=dimension, factor=factor
+        ))
+    UnitConversion.objects.bulk_create(conversions)
+
+
+def rebuild_shopping_lists(apps, schema_editor):
+    RecipeIngridient = apps.get_model('recipes', 'recipeingridient')
+    ShoppingListItem = apps.get_model('recipes', 'shoppinglistitem')
+    rows = RecipeIngridient.objects.filter(
+        recipe__shoppingcart__isnull=False
+    ).annotate(
+        unit=Coalesce(
+            'measurement_unit__conversion__base_unit', 'measurement_unit'
+        )
+    ).values(
+        'recipe__shoppingcart__user', 'ingridient', 'unit'
+    ).annotate(
+        total_amount=Sum(F('amount') * Coalesce(
+            'measurement_unit__conversion__factor', 1,
+            output_field=IntegerField()
+        )),
+        total_recipes=Count('id')
+    ).order_by()
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=row['recipe__shoppingcart__user'],
+            ingridient_id=row['ingridient'],
+            measurement_unit_id=row['unit'],
+            amount=row['total_amount'],
+            recipes_count=row['total_recipes']
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitConversion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('mass', 'mass'), ('volume', 'volume'), ('count', 'count')], max_length=16, verbose_name='dimension')),
+                ('factor', models.PositiveIntegerField(default=1, verbose_name='factor')),
+                ('base_unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.measurementunit', verbose_name='base unit')),
+                ('measurement_unit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='conversion', to='recipes.measurementunit', verbose_name='measurement unit')),
+            ],
+            options={
+                'verbose_name': 'unit conversion',
+                'verbose_name_plural': 'Unit conversions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='unitconversion',
+            constraint=models.CheckConstraint(check=models.Q(('factor__gte', 1)), name='check_unit_conversion_factor'),
+        ),
+        migrations.RunPython(fill_conversions, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 3.2.16 on 2026-10-18 22:30
+
+from django.db import migrations
+from django.db.models import Count, F, IntegerField, Sum
+from django.db.models.functions import Coalesce
+
+# Формы названий единиц (normalize_name) и их перевод в базовую единицу
+# на момент миграции: (формы, размерность, базовая единица, множитель).
+# Копия recipes.validators.UNIT_FORMS намеренно заморожена.
+UNIT_FORMS = (
+    (('г', 'гр', 'грамм', 'грамма', 'граммов'), 'mass', 'грамм', 1),
+    (
+        ('кг', 'килограмм', 'килограмма', 'килограммов'),
+        'mass', 'грамм', 1000
+    ),
+    (
+        ('мл', 'миллилитр', 'миллилитра', 'миллилитров'),
+        'volume', 'миллилитр', 1
+    ),
+    (('л', 'литр', 'литра', 'литров'), 'volume', 'миллилитр', 1000),
+    (('стакан', 'стакана', 'стаканов'), 'volume', 'миллилитр', 250),
+    (
+        ('ст. л.', 'столовая ложка', 'столовые ложки', 'столовых ложек'),
+        'volume', 'миллилитр', 15
+    ),
+    (
+        ('ч. л.', 'чайная ложка', 'чайные ложки', 'чайных ложек'),
+        'volume', 'миллилитр', 5
+    ),
+    (('ложка', 'ложки', 'ложек'), 'volume', 'ложка', 1),
+    (('чашка', 'чашки', 'чашек'), 'volume', 'чашка', 1),
+    (('шт', 'шт.', 'штука', 'штуки', 'штук'), 'count', 'штука', 1),
+    (('десяток', 'десятка', 'десятков'), 'count', 'штука', 10),
+    (('банка', 'банки', 'банок'), 'count', 'банка', 1),
+    (('бутылка', 'бутылки', 'бутылок'), 'count', 'бутылка', 1),
+    (('головка', 'головки', 'головок'), 'count', 'головка', 1),
+    (('долька', 'дольки', 'долек'), 'count', 'долька', 1),
+    (('клубень', 'клубня', 'клубней'), 'count', 'клубень', 1),
+    (('листик', 'листика', 'листиков'), 'count', 'листик', 1),
+    (('плитка', 'плитки', 'плиток'), 'count', 'плитка', 1),
+    (('стейк', 'стейка', 'стейков'), 'count', 'стейк', 1),
+)
+UNIT_CONVERSIONS = {
+    name: (dimension, base_unit, factor)
+    for names, dimension, base_unit, factor in UNIT_FORMS
+    for name in names
+}
+
+
+def normalize_name(value):
+    """Копия recipes.validators.normalize_name на момент миграции."""
+    return ' '.join(str(value).casefold().replace('ё', 'е').split())
+
+
+def add_conversions(apps, schema_editor):
+    """Переводы для единиц, у которых их ещё нет."""
+    MeasurementUnit = apps.get_model('recipes', 'measurementunit')
+    UnitConversion = apps.get_model('recipes', 'unitconversion')
+    units = list(MeasurementUnit.objects.filter(
+        conversion__isnull=True
+    ).order_by('id'))
+    base_units = {}
+    for unit in MeasurementUnit.objects.order_by('id'):
+        base_units.setdefault(normalize_name(unit.name), unit)
+    conversions = []
+    for unit in units:
+        rule = UNIT_CONVERSIONS.get(normalize_name(unit.name))
+        if rule is None:
+            continue
+        dimension, base_name, factor = rule
+        if base_name not in base_units:
+            base_units[base_name] = MeasurementUnit.objects.create(
+                name=base_name
+            )
+            conversions.append(UnitConversion(
+                measurement_unit=base_units[base_name],
+                base_unit=base_units[base_name],
+                dimension=dimension, factor=1
+            ))
+        base_unit = (
+            unit if normalize_name(unit.name) == base_name
+            else base_units[base_name]
+        )
+        conversions.append(UnitConversion(
+            measurement_unit=unit, base_unit=base_unit,
+            dimension=dimension, factor=factor
+        ))
+    UnitConversion.objects.bulk_create(conversions, ignore_conflicts=True)
+
+
+def rebuild_shopping_lists(apps, schema_editor):
+    RecipeIngridient = apps.get_model('recipes', 'recipeingridient')
+    ShoppingListItem = apps.get_model('recipes', 'shoppinglistitem')
+    rows = RecipeIngridient.objects.filter(
+        recipe__shoppingcart__isnull=False
+    ).annotate(
+        unit=Coalesce(
+            'measurement_unit__conversion__base_unit', 'measurement_unit'
+        )
+    ).values(
+        'recipe__shoppingcart__user', 'ingridient', 'unit'
+    ).annotate(
+        total_amount=Sum(F('amount') * Coalesce(
+            'measurement_unit__conversion__factor', 1,
+            output_field=IntegerField()
+        )),
+        total_recipes=Count('id')
+    ).order_by()
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=row['recipe__shoppingcart__user'],
+            ingridient_id=row['ingridient'],
+            measurement_unit_id=row['unit'],
+            amount=row['total_amount'],
+            recipes_count=row['total_recipes']
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_rendered_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_conversions, migrations.RunPython.noop),
+        migrations.RunPython(
+            rebuild_shopping_lists, migrations.RunPython.noop
+        ),
+    ]
@@ -5,11 +5,14 @@ from django.utils.text import format_lazy as _f
 
 from .validators import (
     CHECK_UNUQUE_INGRIDIENT, CHECK_SELF_SUBSCRIBE, CHECK_UNIQUE_SUBSCRIBE,
-    CHECK_UNIQUE_FAVORITE, CHECK_UNIQUE_SHOPPING, DEFAULT_AMOUNT,
-    DEFAULT_COOKING_TIME, DEFAULT_MEASUREMENT_UNIT, LENGTH_COLOR_07,
-    LENGTH_MAIL_254, LENGTH_NAME_150, LENGTH_NAME_200,
+    CHECK_UNIQUE_FAVORITE, CHECK_UNIQUE_FEED_ENTRY, CHECK_UNIQUE_SHOPPING,
+    CHECK_UNIQUE_SHOPPING_LIST_ITEM, CHECK_UNIT_FACTOR,
+    DEFAULT_AMOUNT, DEFAULT_COOKING_TIME, DEFAULT_MEASUREMENT_UNIT,
+    INDEX_FEED_FOLLOWER_AUTHOR, INDEX_RECIPE_AUTHOR, INDEX_RECIPE_UPDATED,
+    INDEX_SUBSCRIBE_FOLLOWER, LENGTH_COLOR_07, LENGTH_DIMENSION_16,
+    LENGTH_MAIL_254, LENGTH_NAME_150, LENGTH_NAME_200, UNIT_DIMENSIONS,
     amount_validator, color_validator, cooking_time_validator,
-    default_name, username_validator
+    default_name, normalize_name, username_validator
 )
 
 
@@ -63,6 +66,20 @@ class User(AbstractUser):
     first_name = CharField150(verbose_name=_('first name'))
     last_name = CharField150(verbose_name=_('last name'))
     password = CharField150(verbose_name=_('password'))
+    recipes_count = models.PositiveIntegerField(
+        verbose_name=_('recipes count'), default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name=_('followers count'), default=0, editable=False
+    )
+    feed_pull = models.BooleanField(
+        verbose_name=_('feed pull mode'),
+        default=False,
+        help_text=_(
+            'Recipes are not copied to followers feeds, '
+            'followers load them when reading the feed.'
+        )
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -102,6 +119,7 @@ class Subscribe(models.Model):
             CHECK_SELF_SUBSCRIBE,
             CHECK_UNIQUE_SUBSCRIBE
         ]
+        indexes = [INDEX_SUBSCRIBE_FOLLOWER]
         verbose_name = _('subscribe')
         verbose_name_plural = _('Subscribes')
 
@@ -142,13 +160,57 @@ class MeasurementUnit(NameList):
         verbose_name_plural = _('Measurement units')
 
 
+class UnitConversion(models.Model):
+    """
+    Перевод единицы измерения в базовую единицу своей размерности:
+    количество в базовой единице - amount * factor.
+    """
+    measurement_unit = models.OneToOneField(
+        to=MeasurementUnit,
+        on_delete=models.CASCADE,
+        related_name='conversion',
+        verbose_name=_('measurement unit')
+    )
+    base_unit = models.ForeignKey(
+        to=MeasurementUnit,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('base unit')
+    )
+    dimension = models.CharField(
+        verbose_name=_('dimension'),
+        max_length=LENGTH_DIMENSION_16,
+        choices=UNIT_DIMENSIONS
+    )
+    factor = models.PositiveIntegerField(verbose_name=_('factor'), default=1)
+
+    class Meta:
+        constraints = [CHECK_UNIT_FACTOR]
+        verbose_name = _('unit conversion')
+        verbose_name_plural = _('Unit conversions')
+
+    def __str__(self) -> str:
+        return f'{self.measurement_unit} = {self.factor} {self.base_unit}'
+
+
 class Ingridient(NameList):
     """Ингридиенты."""
+    search_name = models.CharField(
+        verbose_name=_('search name'),
+        max_length=LENGTH_NAME_200,
+        default='',
+        editable=False,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = _('ingridient')
         verbose_name_plural = _('Ingridients')
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
 
 class Recipe(NameList):
     """Рецепты."""
@@ -167,8 +229,24 @@ class Recipe(NameList):
     image = models.ImageField(
         upload_to='recipes/images/', verbose_name=_('image')
     )
+    rendered_image = models.CharField(
+        verbose_name=_('rendered image'),
+        max_length=100,
+        blank=True,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name=_('updated at'), auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name=_('favorites count'), default=0, editable=False
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        verbose_name=_('shopping carts count'), default=0, editable=False
+    )
 
     class Meta:
+        indexes = [INDEX_RECIPE_AUTHOR, INDEX_RECIPE_UPDATED]
         verbose_name = _('recipe')
         verbose_name_plural = _('Recipes')
 
@@ -246,3 +324,73 @@ class FavoriteList(UserRecipe):
         ]
         verbose_name = _('favorite recipe')
         verbose_name_plural = _('Favorite recipes')
+
+
+class ShoppingListItem(models.Model):
+    """
+    Список покупок пользователя: суммы ингридиентов рецептов корзины
+    в базовых единицах измерения (UnitConversion).
+    recipes_count - число рецептов корзины в строке, строка удаляется,
+    когда их не остаётся.
+    """
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name=_('user')
+    )
+    ingridient = models.ForeignKey(
+        to=Ingridient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('ingridient')
+    )
+    measurement_unit = models.ForeignKey(
+        to=MeasurementUnit,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('measurement unit')
+    )
+    amount = models.IntegerField(verbose_name=_('amount'), default=0)
+    recipes_count = models.IntegerField(
+        verbose_name=_('recipes count'), default=0
+    )
+
+    class Meta:
+        constraints = [CHECK_UNIQUE_SHOPPING_LIST_ITEM]
+        verbose_name = _('shopping list item')
+        verbose_name_plural = _('Shopping list')
+
+    def __str__(self) -> str:
+        return self.ingridient.name
+
+
+class FeedEntry(models.Model):
+    """Лента подписок: рецепты авторов у подписчика."""
+    follower = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name=_('follower')
+    )
+    author = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('author')
+    )
+    recipe = models.ForeignKey(
+        to=Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name=_('recipe')
+    )
+
+    class Meta:
+        constraints = [CHECK_UNIQUE_FEED_ENTRY]
+        indexes = [INDEX_FEED_FOLLOWER_AUTHOR]
+        verbose_name = _('feed entry')
+        verbose_name_plural = _('Feed entries')
+
+    def __str__(self) -> str:
+        return self.recipe.name
@@ -0,0 +1,118 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Ingridient, Recipe, RecipeIngridient
+from .validators import (
+    SEARCH_CHUNK_SIZE, SEARCH_ENDINGS, SEARCH_MIN_STEM, SEARCH_WEIGHTS,
+    normalize_name
+)
+
+# Виртуальная таблица FTS5: rowid - id рецепта, колонки - название,
+# описание и названия ингридиентов. Создаётся миграцией 0013.
+SEARCH_TABLE = 'recipes_recipe_search'
+WORD = re.compile(r'\w+')
+CYRILLIC_WORD = re.compile(r'^[а-я]+$')
+
+
+def get_document_sql():
+    """
+    Вставка строк поиска из рецептов: ё заменяется на е,
+    регистр приводит токенизатор unicode61.
+    Первое заполнение - замороженная копия INSERT_DOCUMENTS
+    в миграции 0013_recipe_search; при изменении документа
+    нужна новая миграция с rebuild по новому запросу.
+    """
+    return f'''
+        INSERT INTO {SEARCH_TABLE} (rowid, name, text, ingridients)
+        SELECT recipe.id,
+               REPLACE(REPLACE(recipe.name, 'ё', 'е'), 'Ё', 'Е'),
+               REPLACE(REPLACE(recipe.text, 'ё', 'е'), 'Ё', 'Е'),
+               COALESCE((
+                   SELECT GROUP_CONCAT(ingridient.search_name, ' ')
+                   FROM {RecipeIngridient._meta.db_table} AS item
+                   JOIN {Ingridient._meta.db_table} AS ingridient
+                     ON ingridient.id = item.ingridient_id
+                   WHERE item.recipe_id = recipe.id
+               ), '')
+        FROM {Recipe._meta.db_table} AS recipe
+    '''
+
+
+def chunks(values):
+    values = list(values)
+    for start in range(0, len(values), SEARCH_CHUNK_SIZE):
+        yield values[start:start + SEARCH_CHUNK_SIZE]
+
+
+def remove_recipes(recipe_ids):
+    with connection.cursor() as cursor:
+        for chunk in chunks(recipe_ids):
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN '
+                f'({", ".join(["%s"] * len(chunk))})',
+                chunk
+            )
+
+
+def index_recipes(recipe_ids):
+    """Перестраивает строки поиска рецептов."""
+    remove_recipes(recipe_ids)
+    with connection.cursor() as cursor:
+        for chunk in chunks(recipe_ids):
+            cursor.execute(
+                f'{get_document_sql()} WHERE recipe.id IN '
+                f'({", ".join(["%s"] * len(chunk))})',
+                chunk
+            )
+
+
+def rebuild():
+    """Заново индексирует все рецепты, возвращает их число."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(get_document_sql())
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def get_stem(word):
+    """Основа русского слова без окончания, прочие слова - как есть."""
+    if not CYRILLIC_WORD.match(word):
+        return word
+    for ending in SEARCH_ENDINGS:
+        stem = word[:-len(ending)]
+        if word.endswith(ending) and len(stem) >= SEARCH_MIN_STEM:
+            return stem
+    return word
+
+
+def get_match_query(value):
+    """
+    Запрос MATCH: все слова поиска как префиксы основ.
+    Кавычки исключают операторы FTS5 из пользовательского ввода.
+    """
+    words = WORD.findall(normalize_name(value))
+    return ' '.join(f'"{get_stem(word)}"*' for word in words)
+
+
+def search_recipes(queryset, value):
+    """
+    Рецепты, подходящие под запрос, по убыванию релевантности BM25.
+    Условие и ранг - подзапросы к таблице поиска, поэтому поиск
+    сочетается с остальными фильтрами и пагинацией в одном запросе.
+    """
+    query = get_match_query(value)
+    if not query:
+        return queryset
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    recipe_id = f'{Recipe._meta.db_table}.{Recipe._meta.pk.column}'
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        (query,)
+    )).alias(search_rank=RawSQL(
+        f'SELECT bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} '
+        f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = {recipe_id}',
+        (query,)
+    )).order_by('search_rank', '-id')
@@ -0,0 +1,134 @@
+from django.db import connection
+from django.db.models import Count, F, IntegerField, Sum
+from django.db.models.functions import Coalesce
+
+from .models import (
+    RecipeIngridient, ShoppingCart, ShoppingListItem, UnitConversion
+)
+
+
+def add_recipes(user_id, recipe_ids, sign=1):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) ингридиенты рецептов
+    в списке покупок пользователя одним INSERT ... ON CONFLICT.
+    Количества переводятся в базовые единицы UnitConversion.
+    Строки, в которых не осталось рецептов, удаляются.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    items = ShoppingListItem._meta.db_table
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {items} (
+                user_id, ingridient_id, measurement_unit_id,
+                amount, recipes_count
+            )
+            SELECT %s, item.ingridient_id,
+                   COALESCE(conversion.base_unit_id, item.measurement_unit_id),
+                   %s * SUM(item.amount * COALESCE(conversion.factor, 1)),
+                   %s * COUNT(*)
+            FROM {RecipeIngridient._meta.db_table} AS item
+            LEFT JOIN {UnitConversion._meta.db_table} AS conversion
+              ON conversion.measurement_unit_id = item.measurement_unit_id
+            WHERE item.recipe_id IN ({placeholders})
+            GROUP BY item.ingridient_id,
+                     COALESCE(conversion.base_unit_id, item.measurement_unit_id)
+            ON CONFLICT (user_id, ingridient_id, measurement_unit_id)
+            DO UPDATE SET
+                amount = {items}.amount + excluded.amount,
+                recipes_count = {items}.recipes_count + excluded.recipes_count
+            ''',
+            [user_id, sign, sign, *recipe_ids]
+        )
+    ShoppingListItem.objects.filter(
+        user_id=user_id, recipes_count__lte=0
+    ).delete()
+
+
+def get_source_rows(users=None, ingridient_ids=None):
+    """
+    Строки списков покупок, посчитанные заново по корзинам,
+    в базовых единицах измерения.
+    """
+    # Условия на корзину - в одном filter(), чтобы группировка
+    # шла по тому же соединению с корзинами.
+    lookups = {'recipe__shoppingcart__isnull': False}
+    if users is not None:
+        lookups['recipe__shoppingcart__user__in'] = users
+    if ingridient_ids is not None:
+        lookups['ingridient__in'] = ingridient_ids
+    queryset = RecipeIngridient.objects.filter(**lookups).annotate(
+        unit=Coalesce(
+            'measurement_unit__conversion__base_unit', 'measurement_unit'
+        )
+    )
+    return queryset.values(
+        'recipe__shoppingcart__user', 'ingridient', 'unit'
+    ).annotate(
+        total_amount=Sum(F('amount') * Coalesce(
+            'measurement_unit__conversion__factor', 1,
+            output_field=IntegerField()
+        )),
+        total_recipes=Count('id')
+    ).order_by()
+
+
+def rebuild(users=None, ingridient_ids=None):
+    """
+    Пересчитывает строки списков покупок пользователей users
+    (все, если не заданы) по ингридиентам ingridient_ids.
+    """
+    items = ShoppingListItem.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+    if ingridient_ids is not None:
+        items = items.filter(ingridient__in=ingridient_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=row['recipe__shoppingcart__user'],
+            ingridient_id=row['ingridient'],
+            measurement_unit_id=row['unit'],
+            amount=row['total_amount'],
+            recipes_count=row['total_recipes']
+        )
+        for row in get_source_rows(users, ingridient_ids)
+    ])
+
+
+def refresh_recipes(recipe_ids, ingridient_ids=None):
+    """
+    Пересчитывает списки покупок пользователей, у которых рецепты
+    recipe_ids в корзине, - только по изменённым ингридиентам.
+    """
+    users = list(ShoppingCart.objects.filter(
+        recipe__in=list(recipe_ids)
+    ).values_list('user', flat=True).distinct())
+    if users:
+        rebuild(users, ingridient_ids)
+
+
+def get_differences():
+    """Строки, в которых список покупок расходится с пересчётом."""
+    expected = {
+        (
+            row['recipe__shoppingcart__user'], row['ingridient'], row['unit']
+        ): (row['total_amount'], row['total_recipes'])
+        for row in get_source_rows().iterator()
+    }
+    actual = {
+        (user, ingridient, measurement_unit): (amount, recipes_count)
+        for user, ingridient, measurement_unit, amount, recipes_count
+        in ShoppingListItem.objects.values_list(
+            'user', 'ingridient', 'measurement_unit',
+            'amount', 'recipes_count'
+        ).iterator()
+    }
+    return {
+        key: (actual.get(key), expected.get(key))
+        for key in expected.keys() | actual.keys()
+        if actual.get(key) != expected.get(key)
+    }
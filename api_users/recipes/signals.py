@@ -0,0 +1,178 @@
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .counters import change_counters
+from .feed import backfill, fan_out, prune
+from .images import schedule_variants
+from .search import index_recipes, remove_recipes
+from .shopping_list import add_recipes, rebuild, refresh_recipes
+from .units import add_conversions
+from .models import (
+    FavoriteList, Ingridient, MeasurementUnit, Recipe, RecipeIngridient,
+    ShoppingCart, Subscribe, Tag, UnitConversion
+)
+
+
+def touch_recipes(**lookups):
+    """Отмечает изменение рецептов, не сохраняя их через save()."""
+    Recipe.objects.filter(**lookups).update(updated_at=timezone.now())
+
+
+def mark_image_rendered(name):
+    """
+    Копии изображения созданы: рецепты начинают ссылаться на них.
+    Вызывается в служебном потоке пула, его соединение закрывается.
+    """
+    Recipe.objects.filter(image=name).update(
+        rendered_image=name, updated_at=timezone.now()
+    )
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+@receiver(post_save, sender=Recipe)
+def render_recipe_image_variants(sender, instance, **kwargs):
+    """Уменьшенные копии изображения создаются после фиксации транзакции."""
+    if instance.rendered_image != instance.image.name:
+        transaction.on_commit(partial(
+            schedule_variants, instance.image.name, mark_image_rendered
+        ))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    """Ингридиенты пишутся после рецепта, индекс - после фиксации."""
+    transaction.on_commit(partial(index_recipes, [instance.pk]))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe(sender, instance, **kwargs):
+    remove_recipes([instance.pk])
+
+
+@receiver(post_save, sender=FavoriteList)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_save, sender=Recipe)
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        change_counters(instance, 1)
+
+
+@receiver(post_delete, sender=FavoriteList)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscribe)
+@receiver(post_delete, sender=Recipe)
+def decrement_counters(sender, instance, **kwargs):
+    change_counters(instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """До удаления: при удалении рецепта его ингридиенты ещё на месте."""
+    add_recipes(instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Subscribe)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance)
+
+
+@receiver(post_delete, sender=Subscribe)
+def prune_feed(sender, instance, **kwargs):
+    prune(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Изменение тэгов рецепта, в том числе со стороны тэга."""
+    if reverse and action == 'pre_clear':
+        touch_recipes(tags=instance)
+    elif reverse and action in ('post_add', 'post_remove'):
+        touch_recipes(pk__in=pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        touch_recipes(pk=instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngridient)
+@receiver(post_delete, sender=RecipeIngridient)
+def touch_recipe_ingridients(sender, instance, **kwargs):
+    touch_recipes(pk=instance.recipe_id)
+    transaction.on_commit(partial(index_recipes, [instance.recipe_id]))
+    refresh_recipes([instance.recipe_id], [instance.ingridient_id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    """Тэги выводятся в рецептах целиком."""
+    if not created:
+        touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingridient)
+def touch_ingridient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(recipes__ingridient=instance)
+        transaction.on_commit(partial(index_recipes, list(
+            RecipeIngridient.objects.filter(
+                ingridient=instance
+            ).values_list('recipe', flat=True)
+        )))
+
+
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(pre_delete, sender=MeasurementUnit)
+def touch_measurement_unit_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(recipes__measurement_unit=instance)
+
+
+def rebuild_unit_shopping_lists(measurement_unit_id):
+    """Пересчёт после фиксации списков покупок с единицей измерения."""
+    users = list(ShoppingCart.objects.filter(
+        recipe__recipes__measurement_unit=measurement_unit_id
+    ).values_list('user', flat=True).distinct())
+    if users:
+        transaction.on_commit(partial(rebuild, users))
+
+
+@receiver(post_save, sender=MeasurementUnit)
+def convert_measurement_unit(sender, instance, created, **kwargs):
+    if created:
+        add_conversions([instance])
+
+
+@receiver(pre_delete, sender=MeasurementUnit)
+def rebuild_measurement_unit_shopping_lists(sender, instance, **kwargs):
+    """
+    Ингридиенты рецептов переходят к единице по умолчанию запросом
+    UPDATE без сигналов: списки покупок пересчитываются после удаления.
+    """
+    rebuild_unit_shopping_lists(instance.pk)
+
+
+@receiver(post_save, sender=UnitConversion)
+@receiver(post_delete, sender=UnitConversion)
+def rebuild_conversion_shopping_lists(sender, instance, **kwargs):
+    """Строки списков покупок с единицей переходят к новой базовой."""
+    rebuild_unit_shopping_lists(instance.measurement_unit_id)
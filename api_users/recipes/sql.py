@@ -0,0 +1,31 @@
+from django.db import connection
+
+
+def delete_rows(model, **conditions):
+    """
+    Удаляет строки модели одним DELETE ... WHERE без сигналов
+    и без предварительной выборки. Условие - поле модели и значение
+    или список значений (IN). Возвращает число удалённых строк.
+    """
+    quote_name = connection.ops.quote_name
+    clauses = []
+    params = []
+    for name, value in conditions.items():
+        column = quote_name(model._meta.get_field(name).column)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = list(value)
+            if not values:
+                return 0
+            placeholders = ', '.join(['%s'] * len(values))
+            clauses.append(f'{column} IN ({placeholders})')
+            params.extend(values)
+        else:
+            clauses.append(f'{column} = %s')
+            params.append(getattr(value, 'pk', value))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote_name(model._meta.db_table)} '
+            f'WHERE {" AND ".join(clauses)}',
+            params
+        )
+        return cursor.rowcount
@@ -0,0 +1,601 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .models import (
+    FavoriteList, FeedEntry, Ingridient, MeasurementUnit, Recipe,
+    RecipeIngridient, ShoppingCart, ShoppingListItem, Subscribe, Tag, User
+)
+from .counters import COUNTERS, recount
+from .search import SEARCH_TABLE
+from .shopping_list import get_differences
+
+
+class ImagePoolMixin:
+    """
+    Сохранение рецепта не отправляет изображение в пул процессов:
+    файлов изображений у тестовых рецептов нет.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        patcher = mock.patch('recipes.signals.schedule_variants')
+        cls.schedule_variants = patcher.start()
+        cls.addClassCleanup(patcher.stop)
+        super().setUpClass()
+
+
+class ShoppingListTest(ImagePoolMixin, APITestCase):
+    """Список покупок совпадает с пересчётом по корзине после изменений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grams = MeasurementUnit.objects.create(name='грамм')
+        cls.author = User.objects.create_user(
+            email='author@test.ru', username='author', password='password'
+        )
+        cls.user = User.objects.create_user(
+            email='user@test.ru', username='user', password='password'
+        )
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.ingridients = [
+            Ingridient.objects.create(name=f'Ингридиент {i}')
+            for i in range(3)
+        ]
+        cls.recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image=f'recipes/images/recipe{i}.png'
+            )
+            for amount, ingridient in enumerate(cls.ingridients, 1):
+                RecipeIngridient.objects.create(
+                    recipe=recipe, ingridient=ingridient,
+                    amount=amount * 10, measurement_unit=cls.grams
+                )
+            cls.recipes.append(recipe)
+        cls.token = Token.objects.create(user=cls.user)
+        cls.author_token = Token.objects.create(user=cls.author)
+
+    def setUp(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_amounts(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingridient__name', 'amount'))
+
+    def assert_consistent(self):
+        self.assertEqual(get_differences(), {})
+
+    def test_cart_endpoints(self):
+        first, second, third = self.recipes
+        self.client.post(f'/api/recipes/{first.id}/shopping_cart/')
+        self.assertEqual(self.get_amounts()['Ингридиент 0'], 10)
+        self.client.post(
+            '/api/recipes/shopping_cart/batch/',
+            {'ids': [second.id, third.id]}, format='json'
+        )
+        self.assertEqual(self.get_amounts()['Ингридиент 2'], 90)
+        self.assert_consistent()
+        self.client.delete(f'/api/recipes/{first.id}/shopping_cart/')
+        self.client.delete(
+            '/api/recipes/shopping_cart/batch/',
+            {'ids': [second.id]}, format='json'
+        )
+        self.assertEqual(self.get_amounts()['Ингридиент 1'], 20)
+        self.assert_consistent()
+        self.client.delete(f'/api/recipes/{third.id}/shopping_cart/')
+        self.assertEqual(self.get_amounts(), {})
+
+    def test_recipe_changes(self):
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.author_token}'
+        )
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/',
+            {
+                'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+                'tags': [self.tag.id],
+                'ingridients': [{'id': self.ingridients[0].id, 'amount': 5}],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_amounts(), {
+            'Ингридиент 0': 25, 'Ингридиент 1': 40, 'Ингридиент 2': 60
+        })
+        self.assert_consistent()
+        self.recipes[1].delete()
+        self.ingridients[2].delete()
+        self.assertEqual(self.get_amounts(), {
+            'Ингридиент 0': 15, 'Ингридиент 1': 20
+        })
+        self.assert_consistent()
+
+    def test_download(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', HTTP_ACCEPT='text/plain'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(),
+            [
+                'Ингридиент 0 (грамм) - 10',
+                'Ингридиент 1 (грамм) - 20',
+                'Ингридиент 2 (грамм) - 30',
+            ]
+        )
+
+    def test_check_command(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        call_command('check_shopping_lists', stdout=StringIO())
+        ShoppingListItem.objects.filter(user=self.user).update(amount=0)
+        with self.assertRaises(CommandError):
+            call_command('check_shopping_lists', stdout=StringIO())
+        call_command('check_shopping_lists', '--fix', stdout=StringIO())
+        self.assert_consistent()
+        self.assertEqual(self.get_amounts()['Ингридиент 2'], 30)
+
+
+class UnitConversionTest(ImagePoolMixin, APITestCase):
+    """Формы одной единицы измерения сводятся к одной строке списка."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@test.ru', username='user', password='password'
+        )
+
+    def add_ingridient(self, name, amount, unit_name):
+        """Отдельный рецепт в корзине для каждой строки ингридиента."""
+        recipe = Recipe.objects.create(
+            author=self.user, name=f'{name} {unit_name}', text='Текст',
+            cooking_time=10, image='recipes/images/recipe.png'
+        )
+        ingridient, _ = Ingridient.objects.get_or_create(name=name)
+        unit, _ = MeasurementUnit.objects.get_or_create(name=unit_name)
+        RecipeIngridient.objects.create(
+            recipe=recipe, ingridient=ingridient,
+            amount=amount, measurement_unit=unit
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def get_amounts(self):
+        self.assertEqual(get_differences(), {})
+        return set(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingridient__name', 'measurement_unit__name', 'amount'))
+
+    def test_inflected_names(self):
+        self.add_ingridient('Мука', 200, 'г')
+        self.add_ingridient('Мука', 1, 'кг')
+        self.add_ingridient('Яйца', 1, 'штука')
+        self.add_ingridient('Яйца', 2, 'штуки')
+        self.add_ingridient('Яйца', 5, 'штук')
+        self.add_ingridient('Молоко', 2, 'стаканов')
+        self.assertEqual(self.get_amounts(), {
+            ('Мука', 'грамм', 1200),
+            ('Яйца', 'штука', 8),
+            ('Молоко', 'миллилитр', 500),
+        })
+
+    def test_units_without_base(self):
+        self.add_ingridient('Чеснок', 1, 'головка')
+        self.add_ingridient('Чеснок', 2, 'головки')
+        self.add_ingridient('Соль', 1, 'по вкусу')
+        self.assertEqual(self.get_amounts(), {
+            ('Чеснок', 'головка', 3),
+            ('Соль', 'по вкусу', 1),
+        })
+
+
+class CountersTest(ImagePoolMixin, APITestCase):
+    """Счётчики рецептов и пользователей при записи и пересчёте."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@test.ru', username='author', password='password'
+        )
+        self.user = User.objects.create_user(
+            email='user@test.ru', username='user', password='password'
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image=f'recipes/images/recipe{i}.png'
+            )
+            for i in range(3)
+        ]
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_counters(self):
+        return (
+            User.objects.values_list(
+                'recipes_count', 'followers_count'
+            ).get(pk=self.author.pk),
+            list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', 'shopping_carts_count'
+            ))
+        )
+
+    def test_signals(self):
+        self.assertEqual(self.get_counters(), ((3, 0), [(0, 0)] * 3))
+        Subscribe.objects.create(follower=self.user, author=self.author)
+        FavoriteList.objects.create(user=self.user, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        self.assertEqual(
+            self.get_counters(), ((3, 1), [(1, 0), (0, 1), (0, 0)])
+        )
+        Subscribe.objects.all().delete()
+        FavoriteList.objects.all().delete()
+        self.recipes[2].delete()
+        self.assertEqual(self.get_counters(), ((2, 0), [(0, 0), (0, 1)]))
+
+    def test_batch(self):
+        ids = [recipe.id for recipe in self.recipes]
+        self.client.post(
+            '/api/recipes/favorite/batch/', {'ids': ids}, format='json'
+        )
+        self.client.post(
+            '/api/recipes/shopping_cart/batch/', {'ids': ids[:2]},
+            format='json'
+        )
+        self.assertEqual(
+            self.get_counters(), ((3, 0), [(1, 1), (1, 1), (1, 0)])
+        )
+        self.client.delete(
+            '/api/recipes/favorite/batch/', {'ids': ids[1:]}, format='json'
+        )
+        self.assertEqual(
+            self.get_counters(), ((3, 0), [(1, 1), (0, 1), (0, 0)])
+        )
+
+    def test_recount_command(self):
+        FavoriteList.objects.create(user=self.user, recipe=self.recipes[0])
+        Recipe.objects.update(favorites_count=5)
+        User.objects.update(recipes_count=0)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn(
+            'recipes.Recipe.favorites_count: 3 rows changed.', out.getvalue()
+        )
+        self.assertIn(
+            'recipes.User.recipes_count: 1 rows changed.', out.getvalue()
+        )
+        self.assertEqual(
+            self.get_counters(), ((3, 0), [(1, 0), (0, 0), (0, 0)])
+        )
+
+    def test_me_after_counter_change(self):
+        """Профиль me не берёт счётчики из снимка в кэше токенов."""
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(
+            self.client.get('/api/users/me/').json()['recipes_count'], 3
+        )
+        Recipe.objects.create(
+            author=self.author, name='Новый', text='Текст',
+            cooking_time=10, image='recipes/images/new.png'
+        )
+        Subscribe.objects.create(follower=self.user, author=self.author)
+        data = self.client.get('/api/users/me/').json()
+        self.assertEqual(
+            (data['recipes_count'], data['followers_count']), (4, 1)
+        )
+
+
+class FeedTest(ImagePoolMixin, APITestCase):
+    """Лента подписок: рассылка, заполнение и очистка, режим чтения."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@test.ru', username='author', password='password'
+        )
+        self.follower = User.objects.create_user(
+            email='follower@test.ru', username='follower', password='password'
+        )
+        token = Token.objects.create(user=self.follower)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text='Текст',
+            cooking_time=10, image='recipes/images/recipe.png'
+        )
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/', {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def get_entries(self):
+        return set(FeedEntry.objects.filter(
+            follower=self.follower
+        ).values_list('recipe__name', flat=True))
+
+    def test_fan_out_backfill_prune(self):
+        self.create_recipe('До подписки')
+        subscribe = Subscribe.objects.create(
+            follower=self.follower, author=self.author
+        )
+        self.assertEqual(self.get_entries(), {'До подписки'})
+        self.create_recipe('После подписки')
+        self.assertEqual(self.get_entries(), {'До подписки', 'После подписки'})
+        self.assertEqual(self.get_feed(), ['После подписки', 'До подписки'])
+        subscribe.delete()
+        self.assertEqual(self.get_entries(), set())
+        self.assertEqual(self.get_feed(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_pull_mode(self):
+        other = User.objects.create_user(
+            email='other@test.ru', username='other', password='password'
+        )
+        Subscribe.objects.create(follower=self.follower, author=self.author)
+        Subscribe.objects.create(follower=other, author=self.author)
+        self.create_recipe('Рецепт')
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.feed_pull)
+        self.assertEqual(self.get_entries(), set())
+        self.assertEqual(self.get_feed(), ['Рецепт'])
+        self.create_recipe('Новый рецепт')
+        self.assertEqual(self.get_feed(), ['Новый рецепт', 'Рецепт'])
+
+    def test_import_fan_out(self):
+        Subscribe.objects.create(follower=self.follower, author=self.author)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'recipes.json'
+            path.write_text(json.dumps([{
+                'name': 'Импорт', 'author': 'author@test.ru',
+                'ingridients': [], 'tags': [],
+            }]), encoding='utf-8')
+            call_command('import_recipes', str(path), stdout=StringIO())
+        self.assertEqual(self.get_entries(), {'Импорт'})
+
+    def test_feed_page_is_range_scan(self):
+        Subscribe.objects.create(follower=self.follower, author=self.author)
+        for i in range(3):
+            self.create_recipe(f'Рецепт {i}')
+        with CaptureQueriesContext(connection) as context:
+            self.get_feed()
+        sql = next(
+            query['sql'] for query in context.captured_queries
+            if 'recipes_feedentry' in query['sql']
+            and 'ORDER BY' in query['sql']
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse(
+            [step for step in plan if step.startswith('SCAN')], plan
+        )
+        self.assertTrue(any(
+            step.startswith('SEARCH') and 'recipes_feedentry' in step
+            for step in plan
+        ), plan)
+
+
+class SearchTest(ImagePoolMixin, APITestCase):
+    """Полнотекстовый поиск ?search= и переиндексация рецептов."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@test.ru', username='author', password='password'
+        )
+        self.other = User.objects.create_user(
+            email='other@test.ru', username='other', password='password'
+        )
+        self.grams = MeasurementUnit.objects.create(name='грамм')
+        self.breakfast = Tag.objects.create(name='Завтрак', slug='breakfast')
+        self.lunch = Tag.objects.create(name='Обед', slug='lunch')
+        self.potato = Ingridient.objects.create(name='Картофель')
+        self.carrot = Ingridient.objects.create(name='Морковь')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.puree = self.create_recipe(
+                self.author, 'Картофельное пюре', 'Отварить и размять.',
+                self.potato, self.breakfast
+            )
+            self.soup = self.create_recipe(
+                self.author, 'Суп', 'В конце добавить пюре.',
+                self.carrot, self.lunch
+            )
+            self.salad = self.create_recipe(
+                self.other, 'Салат', 'Нарезать.', self.carrot, self.lunch
+            )
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def create_recipe(self, author, name, text, ingridient, tag):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text=text,
+            cooking_time=10, image='recipes/images/recipe.png'
+        )
+        recipe.tags.set([tag])
+        RecipeIngridient.objects.create(
+            recipe=recipe, ingridient=ingridient,
+            amount=100, measurement_unit=self.grams
+        )
+        return recipe
+
+    def search(self, value, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': value, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        if isinstance(data, dict):
+            data = data['results']
+        return [recipe['name'] for recipe in data]
+
+    def test_stemmed_match(self):
+        self.assertEqual(self.search('картофельного'), ['Картофельное пюре'])
+        self.assertEqual(self.search('моркови'), ['Салат', 'Суп'])
+
+    def test_name_ranked_above_text(self):
+        self.assertEqual(self.search('пюре'), ['Картофельное пюре', 'Суп'])
+
+    def test_filters_and_cursor_in_one_query(self):
+        FavoriteList.objects.create(user=self.author, recipe=self.soup)
+        FavoriteList.objects.create(user=self.author, recipe=self.salad)
+        with CaptureQueriesContext(connection) as context:
+            names = self.search(
+                'пюре', tags=['lunch', 'dinner'], author=self.author.id,
+                is_favorite=1, cursor=''
+            )
+        self.assertEqual(names, ['Суп'])
+        # Поиск, фильтры и страница по ключу - условия одного SELECT.
+        page_sql = next(
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT "recipes_recipe"."id"')
+        )
+        for part in (
+            'MATCH', 'recipes_recipe_tags', 'recipes_favoritelist',
+            '"recipes_recipe"."author_id" =', 'LIMIT'
+        ):
+            self.assertIn(part, page_sql)
+
+    def test_reindex_after_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.soup.id}/',
+                {'name': 'Борщ'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.search('борщ'), ['Борщ'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.soup.id}/',
+                {'ingridients': [{'id': self.potato.id, 'amount': 300}]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            self.search('картофель'), ['Картофельное пюре', 'Борщ']
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.carrot.name = 'Свёкла'
+            self.carrot.save()
+        self.assertEqual(self.search('свекла'), ['Салат'])
+        self.assertEqual(self.search('моркови'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        self.assertEqual(self.search('пюре'), [])
+        out = StringIO()
+        call_command('rebuild_search', stdout=out)
+        self.assertIn('3 recipes indexed.', out.getvalue())
+        self.assertEqual(self.search('пюре'), ['Картофельное пюре', 'Суп'])
+
+
+class ImportRecipesTest(ImagePoolMixin, APITestCase):
+    """Повторный импорт обновляет рецепты, а не дублирует их."""
+
+    recipes_json = [{
+        'name': 'Омлет', 'author': 'author@test.ru', 'text': 'Взбить.',
+        'tags': [{'slug': 'breakfast', 'name': 'Завтрак'}],
+        'ingridients': [
+            {'name': 'Яйцо', 'amount': 3, 'measurement_unit': 'штук'},
+            {'name': 'Молоко', 'amount': 1, 'measurement_unit': 'стакан'},
+        ],
+    }]
+    recipe_txt = (
+        'Суп\n\nИнгридиенты:\nКартофель 300 грамм;\nСоль по вкусу.\n\n'
+        'Способ приготовления:\nСварить.\n\n'
+        'Тэги:\nОбед (lunch)\n\nАвтор:\nauthor@test.ru.\n'
+    )
+
+    def setUp(self):
+        self.reader = User.objects.create_user(
+            email='reader@test.ru', username='reader', password='password'
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data = Path(directory.name)
+        (self.data / 'recipes.json').write_text(
+            json.dumps(self.recipes_json), encoding='utf-8'
+        )
+        (self.data / 'recipe001.txt').write_text(
+            self.recipe_txt, encoding='utf-8'
+        )
+
+    def import_recipes(self):
+        call_command(
+            'import_recipes', str(self.data), workers=1, stdout=StringIO()
+        )
+
+    def get_rows(self):
+        return {
+            model._meta.label: model.objects.count()
+            for model in (
+                Recipe, Recipe.tags.through, RecipeIngridient, Ingridient,
+                MeasurementUnit, Tag, User, ShoppingListItem
+            )
+        }
+
+    def get_documents(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, ingridients FROM {SEARCH_TABLE} '
+                'ORDER BY rowid'
+            )
+            return cursor.fetchall()
+
+    def assertConsistent(self):
+        for source, field, model, counter in COUNTERS:
+            self.assertEqual(
+                recount(source, field, model, counter), 0, model
+            )
+        self.assertEqual(get_differences(), {})
+        self.assertEqual(
+            [id for id, _ in self.get_documents()],
+            list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_rerun(self):
+        self.import_recipes()
+        omelette = Recipe.objects.get(name='Омлет')
+        ShoppingCart.objects.create(user=self.reader, recipe=omelette)
+        FavoriteList.objects.create(user=self.reader, recipe=omelette)
+        rows = self.get_rows()
+        documents = self.get_documents()
+        self.assertEqual(rows['recipes.Recipe'], 2)
+        self.assertConsistent()
+
+        self.import_recipes()
+        self.assertEqual(self.get_rows(), rows)
+        self.assertEqual(self.get_documents(), documents)
+        self.assertConsistent()
+
+        (self.data / 'recipes.json').write_text(json.dumps([
+            dict(self.recipes_json[0], ingridients=[
+                {'name': 'Яйцо', 'amount': 5, 'measurement_unit': 'штук'},
+                {'name': 'Сыр', 'amount': 50, 'measurement_unit': 'грамм'},
+            ])
+        ]), encoding='utf-8')
+        self.import_recipes()
+        self.assertEqual(
+            set(RecipeIngridient.objects.filter(
+                recipe=omelette
+            ).values_list('ingridient__name', 'amount')),
+            {('Яйцо', 5), ('Сыр', 50)}
+        )
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertConsistent()
+        self.assertEqual(
+            User.objects.get(email='author@test.ru').recipes_count, 2
+        )
@@ -0,0 +1,35 @@
+from .models import MeasurementUnit, UnitConversion
+from .validators import UNIT_CONVERSIONS, normalize_name
+
+
+def get_base_unit(name, base_units):
+    """Базовая единица по названию, создаётся при отсутствии."""
+    if name not in base_units:
+        base_units[name] = MeasurementUnit.objects.filter(
+            name=name
+        ).order_by('id').first() or MeasurementUnit.objects.create(name=name)
+    return base_units[name]
+
+
+def add_conversions(units):
+    """
+    Переводы для единиц измерения, названия которых есть в
+    UNIT_CONVERSIONS. Единицы с переводом не меняются.
+    """
+    base_units = {}
+    conversions = []
+    for unit in units:
+        rule = UNIT_CONVERSIONS.get(normalize_name(unit.name))
+        if rule is None:
+            continue
+        dimension, base_name, factor = rule
+        base_unit = (
+            unit if normalize_name(unit.name) == base_name
+            else get_base_unit(base_name, base_units)
+        )
+        conversions.append(UnitConversion(
+            measurement_unit=unit, base_unit=base_unit,
+            dimension=dimension, factor=factor
+        ))
+    UnitConversion.objects.bulk_create(conversions, ignore_conflicts=True)
+    return len(conversions)
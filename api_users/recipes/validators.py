@@ -1,22 +1,124 @@
 import re
 
-from django.db.models import CheckConstraint, Q, F, UniqueConstraint
+from django.db.models import CheckConstraint, Index, Q, F, UniqueConstraint
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import format_lazy as _f
 from rest_framework.exceptions import ValidationError
 
 
+BASE64_CHUNK_SIZE = 64 * 1024
+# Результаты пакетного добавления и удаления рецептов по id.
+BATCH_ADDED = 'added'
+BATCH_EXISTS = 'exists'
+# Число попыток вставки пакета, если параллельный запрос добавил
+# те же рецепты.
+BATCH_INSERT_ATTEMPTS = 3
+BATCH_NOT_FOUND = 'not_found'
+BATCH_REMOVED = 'removed'
+BASE64_MARKER = ';base64,'
 DEFAULT_AMOUNT = 1
 DEFAULT_COOKING_TIME = 1
 DEFAULT_LIST_LIMIT = 10
 DEFAULT_MEASUREMENT_UNIT = 1
+DEFAULT_TAG_COLOR = '#FFFFFF'
+FEED_BACKFILL_LIMIT = 1000
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'medium': (640, 640),
+}
+IMAGE_VARIANTS_DIR = 'variants'
+IMAGE_VARIANT_EXTENSION = 'webp'
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
+IMPORT_BATCH_SIZE = 1000
+IMPORT_READ_SIZE = 1024 * 1024
 LENGTH_COLOR_04 = 4
 LENGTH_COLOR_07 = 7
+LENGTH_DIMENSION_16 = 16
 LENGTH_MAIL_254 = 254
 LENGTH_NAME_150 = 150
 LENGTH_NAME_200 = 200
+# Число рецептов в одном пакетном добавлении или удалении.
+MAX_BATCH_SIZE = 100
+MAX_DATA_URI_HEADER = 64
 MAX_LENGTH_SLUG = 200
+MAX_LIST_LIMIT = 50
+PIECE_UNIT = 'штука'
+PREFIX_UPPER_BOUND = '\U0010ffff'
 REGEX_FOR_USERNAME = r'^[\w.@+-]+\Z'
+# Окончания русских слов, отбрасываемые в запросе полнотекстового поиска:
+# основа ищется по началу слова (суп* - супы, супа, супом).
+SEARCH_ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'иям', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми',
+    'ими', 'ией', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой',
+    'ей', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю',
+    'ия', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+), key=len, reverse=True))
+# Число рецептов в одном запросе переиндексации.
+SEARCH_CHUNK_SIZE = 500
+SEARCH_MIN_STEM = 3
+# Веса BM25 для колонок поиска: название, описание, ингридиенты.
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+TO_TASTE_UNIT = 'по вкусу'
+# Размерности единиц измерения.
+UNIT_COUNT = 'count'
+UNIT_MASS = 'mass'
+UNIT_VOLUME = 'volume'
+UNIT_DIMENSIONS = (
+    (UNIT_MASS, _('mass')),
+    (UNIT_VOLUME, _('volume')),
+    (UNIT_COUNT, _('count')),
+)
+# Формы названий единиц измерения (normalize_name) и их перевод
+# в базовую единицу: (формы, размерность, базовая единица, множитель).
+# Единицы без перевода в граммы, миллилитры или штуки сводятся к одной
+# форме, чтобы "головка" и "головки" были одной строкой списка покупок.
+UNIT_FORMS = (
+    (('г', 'гр', 'грамм', 'грамма', 'граммов'), UNIT_MASS, 'грамм', 1),
+    (
+        ('кг', 'килограмм', 'килограмма', 'килограммов'),
+        UNIT_MASS, 'грамм', 1000
+    ),
+    (
+        ('мл', 'миллилитр', 'миллилитра', 'миллилитров'),
+        UNIT_VOLUME, 'миллилитр', 1
+    ),
+    (('л', 'литр', 'литра', 'литров'), UNIT_VOLUME, 'миллилитр', 1000),
+    (('стакан', 'стакана', 'стаканов'), UNIT_VOLUME, 'миллилитр', 250),
+    (
+        ('ст. л.', 'столовая ложка', 'столовые ложки', 'столовых ложек'),
+        UNIT_VOLUME, 'миллилитр', 15
+    ),
+    (
+        ('ч. л.', 'чайная ложка', 'чайные ложки', 'чайных ложек'),
+        UNIT_VOLUME, 'миллилитр', 5
+    ),
+    (('ложка', 'ложки', 'ложек'), UNIT_VOLUME, 'ложка', 1),
+    (('чашка', 'чашки', 'чашек'), UNIT_VOLUME, 'чашка', 1),
+    (('шт', 'шт.', 'штука', 'штуки', 'штук'), UNIT_COUNT, PIECE_UNIT, 1),
+    (('десяток', 'десятка', 'десятков'), UNIT_COUNT, PIECE_UNIT, 10),
+    (('банка', 'банки', 'банок'), UNIT_COUNT, 'банка', 1),
+    (('бутылка', 'бутылки', 'бутылок'), UNIT_COUNT, 'бутылка', 1),
+    (('головка', 'головки', 'головок'), UNIT_COUNT, 'головка', 1),
+    (('долька', 'дольки', 'долек'), UNIT_COUNT, 'долька', 1),
+    (('клубень', 'клубня', 'клубней'), UNIT_COUNT, 'клубень', 1),
+    (('листик', 'листика', 'листиков'), UNIT_COUNT, 'листик', 1),
+    (('плитка', 'плитки', 'плиток'), UNIT_COUNT, 'плитка', 1),
+    (('стейк', 'стейка', 'стейков'), UNIT_COUNT, 'стейк', 1),
+)
+# Название единицы (normalize_name) -> (размерность, базовая единица,
+# множитель).
+UNIT_CONVERSIONS = {
+    name: (dimension, base_unit, factor)
+    for names, dimension, base_unit, factor in UNIT_FORMS
+    for name in names
+}
 
 
 # Проверка уникальности ингридиента в рецепте
@@ -55,6 +157,49 @@ CHECK_UNUQUE_INGRIDIENT = UniqueConstraint(
     name=_('unique ingridient in recipe')
 )
 
+# Рецепты автора от новых к старым (фильтр author, пагинация по ключу).
+INDEX_RECIPE_AUTHOR = Index(
+    fields=['author', '-id'],
+    name='recipe_author_id_idx'
+)
+
+# Записи ленты подписчика от новых рецептов к старым.
+CHECK_UNIQUE_FEED_ENTRY = UniqueConstraint(
+    fields=['follower', 'recipe'],
+    name='unique_feed_entry'
+)
+
+# Записи ленты подписчика по автору (удаление при отписке).
+INDEX_FEED_FOLLOWER_AUTHOR = Index(
+    fields=['follower', 'author', 'recipe'],
+    name='feed_follower_author_idx'
+)
+
+# Время последнего изменения и число рецептов (ETag списка):
+# чтение узкого индекса вместо строк рецептов.
+INDEX_RECIPE_UPDATED = Index(
+    fields=['updated_at'],
+    name='recipe_updated_at_idx'
+)
+
+# Множитель перевода в базовую единицу не меньше единицы.
+CHECK_UNIT_FACTOR = CheckConstraint(
+    check=Q(factor__gte=1),
+    name='check_unit_conversion_factor'
+)
+
+# Строка списка покупок пользователя: ингридиент в базовой единице.
+CHECK_UNIQUE_SHOPPING_LIST_ITEM = UniqueConstraint(
+    fields=['user', 'ingridient', 'measurement_unit'],
+    name='unique_shopping_list_item'
+)
+
+# Подписки пользователя по возрастанию id автора.
+INDEX_SUBSCRIBE_FOLLOWER = Index(
+    fields=['follower', 'author'],
+    name='subscribe_follower_author_idx'
+)
+
 def amount_validator(value):
     if value < 0:
         raise ValidationError(_f(
@@ -79,6 +224,10 @@ def cooking_time_validator(value):
 def default_name():
     return _('name is not set')
 
+def normalize_name(value):
+    """Название для поиска: нижний регистр, ё -> е, одиночные пробелы."""
+    return ' '.join(str(value).casefold().replace('ё', 'е').split())
+
 def regex_validator(value, regex, code=''):
     """Проверка на соответствие регулярному выражению."""
     s_value = str(value)